@@ -0,0 +1,173 @@
+"""
+On-disk bank of solved boards, one file per (width, height, pushes). Every record in a file has the same size, so a
+board is read by index straight from a memory map without loading the rest of the file.
+
+    python bank.py WIDTH HEIGHT COUNT [--difficulty D] [--duration SECONDS] [--workers N] [--graded]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+
+import prefilter
+from generator import BoardGenerator
+from solver import Solver
+
+BANK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bank")
+# Solve cache shared by the game's and this script's worker processes, see utils.persistCache
+CACHE_FILE = os.path.join(BANK_DIR, "solves.json")
+MAGIC = b"BLDR"
+HEADER = struct.Struct("<4sBHHH")
+VERSION = 1
+MOVE = struct.Struct("<I")
+
+
+class BankFile:
+    """Fixed-size records of (packed grid, moves) for one board size and push count"""
+
+    def __init__(self, path, width, height, pushes):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.pushes = pushes
+        self.gridBytes = (width * height + 7) // 8
+        self.recordSize = self.gridBytes + pushes * MOVE.size
+        self._file = None
+        self._map = None
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(HEADER.pack(MAGIC, VERSION, width, height, pushes))
+
+    def count(self) -> int:
+        return (os.path.getsize(self.path) - HEADER.size) // self.recordSize
+
+    def read(self, index: int):
+        """The payload at index, in the (grid, [(x, y, offsetType), ...]) form of utils.createBestPayload"""
+        start = HEADER.size + index * self.recordSize
+        if self._map is None or len(self._map) < start + self.recordSize:
+            self._remap()
+        record = self._map[start:start + self.recordSize]
+        grid = Solver.unpackGrid(int.from_bytes(record[:self.gridBytes], "little"), self.width, self.height)
+        moves = []
+        for (code,) in MOVE.iter_unpack(record[self.gridBytes:]):
+            index = code >> 3
+            moves.append((index // self.height, index % self.height, code & 7))
+        return grid, moves
+
+    def append(self, payload):
+        grid, moves = payload
+        record = Solver.packGrid(grid).to_bytes(self.gridBytes, "little")
+        record += b"".join(MOVE.pack((x * self.height + y) << 3 | offsetType) for x, y, offsetType in moves)
+        with open(self.path, "ab") as f:
+            f.write(record)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._map = self._file = None
+
+    def _remap(self):
+        self.close()
+        self._file = open(self.path, "rb")
+        magic, version, width, height, pushes = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or (width, height, pushes) != (self.width, self.height, self.pushes):
+            raise ValueError(f"{self.path} is not a version {VERSION} bank for {self.width}x{self.height}, "
+                             f"{self.pushes} pushes")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PuzzleBank:
+    """
+    Boards indexed by (width, height, required pushes). Width and height follow utils.createBest, so a board has
+    width rows of height cells.
+    """
+
+    def __init__(self, directory: str = BANK_DIR):
+        self._directory = directory
+        self._files = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def count(self, width, height, pushes) -> int:
+        bankFile = self._find(width, height, pushes)
+        return 0 if bankFile is None else bankFile.count()
+
+    def get(self, width, height, pushes, index):
+        return self._open(width, height, pushes).read(index)
+
+    def random(self, width, height, minPushes=1, maxPushes=None):
+        """A uniformly random stored board with a push count in range, or None when there is none"""
+        counts = []
+        for pushes in self.pushCounts(width, height):
+            if pushes >= minPushes and (maxPushes is None or pushes <= maxPushes):
+                counts.append((pushes, self.count(width, height, pushes)))
+        total = sum(count for _, count in counts)
+        if total == 0:
+            return None
+        index = random.randrange(total)
+        for pushes, count in counts:
+            if index < count:
+                return self.get(width, height, pushes, index)
+            index -= count
+
+    def add(self, payload):
+        grid, moves = payload
+        self._open(len(grid), len(grid[0]), len(moves)).append(payload)
+
+    def close(self):
+        for bankFile in self._files.values():
+            bankFile.close()
+        self._files.clear()
+
+    def pushCounts(self, width, height) -> list:
+        prefix = f"{width}x{height}-"
+        counts = []
+        for name in os.listdir(self._directory):
+            if name.startswith(prefix) and name.endswith(".bank") and name[len(prefix):-5].isdigit():
+                counts.append(int(name[len(prefix):-5]))
+        return sorted(counts)
+
+    def _path(self, width, height, pushes) -> str:
+        return os.path.join(self._directory, f"{width}x{height}-{pushes}.bank")
+
+    def _find(self, width, height, pushes):
+        if (width, height, pushes) not in self._files and not os.path.exists(self._path(width, height, pushes)):
+            return None
+        return self._open(width, height, pushes)
+
+    def _open(self, width, height, pushes) -> BankFile:
+        key = (width, height, pushes)
+        if key not in self._files:
+            self._files[key] = BankFile(self._path(width, height, pushes), width, height, pushes)
+        return self._files[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("count", type=int, help="boards to attempt")
+    parser.add_argument("--difficulty", type=int, default=3)
+    parser.add_argument("--duration", type=int, default=10,
+                        help="createBest budget per board in seconds, or for the whole batch with --graded")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--graded", action="store_true",
+                        help="bank random boards solved in one batch by prefilter.graded instead of createBest boards")
+    args = parser.parse_args()
+
+    bank = PuzzleBank()
+    if args.graded:
+        for payload in prefilter.graded(args.count, args.width, args.height, args.difficulty, args.duration * 1000):
+            bank.add(payload)
+    else:
+        generator = BoardGenerator(args.workers, CACHE_FILE)
+        for payload in generator.generate(args.width, args.height, args.difficulty, args.duration, args.count):
+            bank.add(payload)
+        generator.shutdown()
+    for pushes in bank.pushCounts(args.width, args.height):
+        print(f"{args.width}x{args.height}, {pushes} pushes: {bank.count(args.width, args.height, pushes)} boards")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Breadth first search over many boards at once. Layouts and player regions are bitboards in uint64 arrays (bit
+x * cols + y is the cell (x, y), as in solver.BitMasks), successors of a whole layer are made with array bit
+operations, and duplicates are removed with one sort per chunk and per layer. Each board keeps its visited states as
+a sorted array checked with searchsorted, and its parent links per layer, both dropped as soon as it is done. The
+per-node interpreter overhead of Solver.solve is paid per chunk and per board instead.
+"""
+import collections
+import time
+
+import numpy as np
+
+from data.move import Move
+from data.point import Point
+
+MAX_CELLS = 64
+# States a layer is expanded in at a time, the deadline is checked between chunks
+CHUNK = 4096
+# States one board may keep, about as many as Solver.solve visits in its TIME_LIMIT. A board past it is left to the
+# scalar Solver
+BOARD_BUDGET = 200_000
+# States the boards of a batch may keep together, about 22 bytes each. Past it the boards holding the most are left
+# to the scalar Solver, which can spill to disk
+STATE_BUDGET = 4_000_000
+
+
+class ArrayMasks:
+    """solver.BitMasks as uint64 scalars"""
+
+    def __init__(self, rows: int, cols: int):
+        def word(bits):
+            return np.uint64(bits)
+
+        self.rows = rows
+        self.cols = cols
+        full = (1 << rows * cols) - 1
+        firstRow = (1 << cols) - 1
+        firstCol = 0
+        for x in range(rows):
+            firstCol |= 1 << x * cols
+        self.full = word(full)
+        self.firstRow = word(firstRow)
+        self.notFirstCol = word(full ^ firstCol)
+        self.notLastCol = word(full ^ (firstCol << cols - 1))
+        self.pushable = word(full & ~(firstRow | firstRow << (rows - 1) * cols))
+        self.one = np.uint64(1)
+        self.colShift = np.uint64(cols)
+
+
+def solveMany(boards, deadline: float) -> list:
+    """
+     * @param boards - list of 0/1 grids of at most MAX_CELLS cells, sizes may differ
+     * @param deadline - time.monotonic() value to stop at, unfinished boards get (0, None)
+     * @return (pushes, moves) for every board, moves in the deque of Move form of Solver.getSolvedMoves, (0, None)
+     *         when no solution was found, or None for a board left out to keep within BOARD_BUDGET or STATE_BUDGET states
+     """
+    results = [(0, None)] * len(boards)
+    groups = collections.defaultdict(list)
+    for i, board in enumerate(boards):
+        if len(board) * len(board[0]) > MAX_CELLS:
+            raise ValueError(f"batchsolver packs boards into 64 bits, a {len(board)}x{len(board[0])} board is too big")
+        groups[(len(board), len(board[0]))].append(i)
+    for (rows, cols), ids in groups.items():
+        masks = ArrayMasks(rows, cols)
+        layouts = np.array([_pack(boards[i], cols) for i in ids], dtype=np.uint64)
+        for i, result in zip(ids, _solveGroup(layouts, masks, deadline)):
+            results[i] = result
+    return results
+
+
+def _pack(board, cols: int) -> int:
+    bits = 0
+    for x, row in enumerate(board):
+        for y, val in enumerate(row):
+            if val == 1:
+                bits |= 1 << x * cols + y
+    return bits
+
+
+def _grow(region: np.ndarray, masks: ArrayMasks) -> np.ndarray:
+    one = masks.one
+    return (region | (region << masks.colShift) | (region >> masks.colShift) | ((region << one) & masks.notFirstCol)
+            | ((region >> one) & masks.notLastCol)) & masks.full
+
+
+def _flood(region: np.ndarray, passable: np.ndarray, masks: ArrayMasks) -> np.ndarray:
+    while True:
+        grown = _grow(region, masks) & passable
+        if np.array_equal(grown, region):
+            return region
+        region = grown
+
+
+def _pushes(regions: np.ndarray, layouts: np.ndarray, masks: ArrayMasks):
+    """Candidate boxes for each offsetType, as in Solver._packedPushes, with the shift of the block's step"""
+    one = masks.one
+    cols = masks.colShift
+    empty = masks.full & ~layouts
+    boxes = layouts & masks.pushable
+    yield 1, boxes & (regions >> cols) & (empty << cols), -masks.cols
+    yield 2, boxes & (regions << cols) & (empty >> cols), masks.cols
+    yield 3, boxes & (regions >> one) & masks.notLastCol & (empty << one) & masks.notFirstCol, -1
+    yield 4, boxes & (regions << one) & masks.notFirstCol & (empty >> one) & masks.notLastCol, 1
+
+
+def _frozen(layouts: np.ndarray, masks: ArrayMasks) -> np.ndarray:
+    """Solver._frozen for every layout at once"""
+    one = masks.one
+    cols = masks.colShift
+    frozen = layouts.copy()
+    while True:
+        free = masks.full & ~frozen
+        vertical = (free >> cols) & (free << cols)
+        horizontal = (free >> one) & masks.notLastCol & (free << one) & masks.notFirstCol
+        thawed = frozen & masks.pushable & (vertical | horizontal)
+        if not thawed.any():
+            return frozen
+        frozen ^= thawed
+
+
+def _deadPushes(regions: np.ndarray, dest: np.ndarray, layouts: np.ndarray, masks: ArrayMasks) -> np.ndarray:
+    """Solver._isDeadPush for every push at once, with the frozen sets only built where dest has no open axis"""
+    one = masks.one
+    cols = masks.colShift
+    zero = np.uint64(0)
+    empty = masks.full & ~layouts
+    vertical = (((dest >> cols) & empty) != zero) & (((dest << cols) & empty) != zero)
+    horizontal = (((dest >> one) & masks.notLastCol & empty) != zero) & \
+                 (((dest << one) & masks.notFirstCol & empty) != zero)
+    dead = ((dest & masks.pushable) == zero) | ~(vertical | horizontal)
+    check = np.flatnonzero(dead)
+    frozen = _frozen(layouts[check], masks)
+    cut = (frozen & dest[check]) != zero
+    cut[cut] = (_flood(regions[check][cut], masks.full & ~frozen[cut], masks) & masks.firstRow) == zero
+    dead[check] = cut
+    return dead
+
+
+def _keys(owner: np.ndarray, layouts: np.ndarray, regions: np.ndarray) -> np.ndarray:
+    """One void key per state: board, lowest cell of the player region and layout, big-endian so they sort by board"""
+    lowest = regions & (~regions + np.uint64(1))
+    raw = np.stack((owner.astype(np.uint64), lowest, layouts), axis=1).astype(">u8")
+    return np.ascontiguousarray(raw).view(np.dtype((np.void, 24))).ravel()
+
+
+def _stateKeys(keys: np.ndarray) -> np.ndarray:
+    """The keys without the board, as kept in a board's own visited array"""
+    raw = keys.view(np.uint8).reshape(-1, 24)[:, 8:]
+    return np.ascontiguousarray(raw).view(np.dtype((np.void, 16))).ravel()
+
+
+def _segments(owner: np.ndarray):
+    """(board, start, end) of each run of states of one board in a sorted owner array"""
+    boards, starts = np.unique(owner, return_index=True)
+    return zip(boards.tolist(), starts.tolist(), starts[1:].tolist() + [len(owner)])
+
+
+def _unseen(keys: np.ndarray, owner: np.ndarray, visited: list) -> np.ndarray:
+    """Mask of the sorted, unique keys their board has not visited, found with one searchsorted per board"""
+    stateKeys = _stateKeys(keys)
+    new = np.ones(len(keys), dtype=bool)
+    for board, start, end in _segments(owner):
+        seen = visited[board]
+        found = np.searchsorted(seen, stateKeys[start:end])
+        new[start:end] = seen[np.minimum(found, len(seen) - 1)] != stateKeys[start:end]
+    return new
+
+
+def _solveGroup(layouts: np.ndarray, masks: ArrayMasks, deadline: float) -> list:
+    count = len(layouts)
+    results = [(0, None)] * count
+    start = np.full(count, np.uint64(1 << (masks.rows - 1) * masks.cols), dtype=np.uint64)
+    regions = _flood(start, masks.full & ~layouts, masks)
+    owner = np.arange(count)
+    done = (regions & masks.firstRow) != 0
+    for i in np.flatnonzero(done):
+        results[i] = (0, collections.deque())
+    keep = ~done
+    layouts, regions, owner = layouts[keep], regions[keep], owner[keep]
+    # Per board, the sorted keys of every state it reached, and per layer after the first the index of each state's
+    # parent among the board's states of the layer before and its push as cell << 3 | offsetType. Both are None
+    # once the board is solved, out of pushes or over budget, so its arrays are freed
+    visited = [None] * count
+    history = [None] * count
+    for j, board in enumerate(owner.tolist()):
+        visited[board] = _stateKeys(_keys(owner[j:j + 1], layouts[j:j + 1], regions[j:j + 1]))
+        history[board] = []
+    cells = np.arange(MAX_CELLS)
+
+    while len(owner) > 0:
+        # The layer is sorted by board, so each board's states start here
+        firsts = np.searchsorted(owner, np.arange(count))
+        found = []
+        for begin in range(0, len(owner), CHUNK):
+            if time.monotonic() >= deadline:
+                return results
+            chunk = slice(begin, begin + CHUNK)
+            index, cell, offsetTypes, steps = [], [], [], []
+            for offsetType, pushable, step in _pushes(regions[chunk], layouts[chunk], masks):
+                bits = np.unpackbits(pushable.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+                state, bit = np.nonzero(bits)
+                index.append(state + begin)
+                cell.append(cells[bit])
+                offsetTypes.append(np.full(len(state), offsetType))
+                steps.append(np.full(len(state), step))
+            index = np.concatenate(index)
+            if len(index) == 0:
+                continue
+            cell = np.concatenate(cell)
+            box = np.left_shift(masks.one, cell.astype(np.uint64))
+            dest = np.left_shift(masks.one, (cell + np.concatenate(steps)).astype(np.uint64))
+            children = layouts[index] ^ box ^ dest
+            childRegions = _flood(box, masks.full & ~children, masks)
+            # As in Solver._solvePacked, a push that leaves row 0 out of reach for good is not searched further
+            live = ((childRegions & masks.firstRow) != 0) | ~_deadPushes(childRegions, dest, children, masks)
+            index, cell, children, childRegions = index[live], cell[live], children[live], childRegions[live]
+            offsetTypes = np.concatenate(offsetTypes)[live]
+            childOwner = owner[index]
+            keys, first = np.unique(_keys(childOwner, children, childRegions), return_index=True)
+            new = _unseen(keys, childOwner[first], visited)
+            first = first[new]
+            found.append((keys[new], index[first], (cell << 3 | offsetTypes)[first], children[first],
+                          childRegions[first], childOwner[first]))
+        if not found:
+            break
+        # Chunks can reach the same state, the layer's keys are made unique once more across them
+        keys, first = np.unique(np.concatenate([piece[0] for piece in found]), return_index=True)
+        index, codes, children, childRegions, childOwner = (np.concatenate([piece[i] for piece in found])[first]
+                                                            for i in range(1, 6))
+        stateKeys = _stateKeys(keys)
+        solved = (childRegions & masks.firstRow) != 0
+        keep = np.zeros(len(keys), dtype=bool)
+        for board, begin, end in _segments(childOwner):
+            history[board].append(((index[begin:end] - firsts[board]).astype(np.int32),
+                                   codes[begin:end].astype(np.int16)))
+            hits = np.flatnonzero(solved[begin:end])
+            if len(hits) > 0:
+                # Every state of a shallower layer was checked already, so this is a shortest solution
+                results[board] = _rebuild(history[board], int(hits[0]), masks.cols)
+                visited[board] = history[board] = None
+                continue
+            seen = visited[board]
+            added = stateKeys[begin:end]
+            visited[board] = np.insert(seen, np.searchsorted(seen, added), added)
+            keep[begin:end] = True
+        live = set(childOwner[keep].tolist())
+        for board, seen in enumerate(visited):
+            if seen is not None and board not in live:
+                # Out of pushes, so the board has no solution
+                visited[board] = history[board] = None
+        sizes = {board: len(seen) for board, seen in enumerate(visited) if seen is not None}
+        total = sum(sizes.values())
+        for board in sorted(sizes, key=sizes.get, reverse=True):
+            if sizes[board] <= BOARD_BUDGET and total <= STATE_BUDGET:
+                break
+            total -= sizes[board]
+            results[board] = None
+            visited[board] = history[board] = None
+            keep &= childOwner != board
+        layouts, regions, owner = children[keep], childRegions[keep], childOwner[keep]
+    return results
+
+
+def _rebuild(history: list, index: int, cols: int):
+    moves = collections.deque()
+    for parents, codes in reversed(history):
+        code = int(codes[index])
+        move = Move()
+        move.p = Point((code >> 3) // cols, (code >> 3) % cols)
+        move.offsetType = code & 7
+        moves.appendleft(move)
+        index = int(parents[index])
+    return len(moves), moves
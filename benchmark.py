@@ -0,0 +1,289 @@
+"""
+Headless solver and generator benchmarks over seeded board corpora, printed as JSON. Two saved runs can be compared,
+which flags every measurement that got worse by more than the threshold and exits with status 1.
+
+    python benchmark.py [--sizes 6 8 10] [--count N] [--duration SECONDS] [--generation] [--output FILE]
+    python benchmark.py --compare OLD.json NEW.json [--threshold 0.1]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from copy import deepcopy
+
+import prefilter
+import utils
+from data.solvestats import SolveStats
+from generator import BoardGenerator
+from solver import TIME_LIMIT, Solver
+
+SIZES = (6, 8, 10)
+DIFFICULTIES = (1, 2, 3, 4)
+# Measurements where a larger value is better, everything else numeric is a cost
+HIGHER_IS_BETTER = ("PerSecond", "PerMinute", "acceptanceRate", "solved", "accepted", "pushes", "calls",
+                    "nodesPruned", "layoutsRemoved", "speedup")
+# Timings below this many seconds are timer noise and never count as regressions
+NOISE_SECONDS = 0.001
+
+
+def corpus(size, count=40, seed=0):
+    """Random size x size boards from utils.randomBoard, the same for every run with the same seed"""
+    random.seed(seed * 1_000 + size)
+    return [utils.randomBoard(size, size, DIFFICULTIES[i % len(DIFFICULTIES)]) for i in range(count)]
+
+
+def candidates(size, difficulty, count=10, seed=0):
+    """Seeded boards that passed prefilter.plausible, so most of them need a real search"""
+    prefilter.seed(seed * 1_000 + size * 10 + difficulty)
+    boards = []
+    while len(boards) < count:
+        board = prefilter.nextCandidate(size, size, difficulty)
+        if board is not None:
+            boards.append(board)
+    return boards
+
+
+def percentiles(values) -> dict:
+    """Nearest rank p50 and p95 of values"""
+    if not values:
+        return {"p50": None, "p95": None}
+    ordered = sorted(values)
+
+    def rank(q):
+        return round(ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))], 4)
+
+    return {"p50": rank(0.5), "p95": rank(0.95)}
+
+
+def solving(boards):
+    """
+    Solver.solve latency per board and its search rate. States are the layouts in the solver's visited map, so
+    the rate is comparable between searches that keep different things per layout.
+    """
+    seconds = []
+    states = solved = 0
+    for board in boards:
+        solver = Solver(deepcopy(board))
+        start = time.perf_counter()
+        if solver.solve() != 0:
+            solved += 1
+        seconds.append(time.perf_counter() - start)
+        states += len(solver.visited)
+    return {"boards": len(boards), "solved": solved, "seconds": percentiles(seconds),
+            "statesPerSecond": round(states / max(sum(seconds), 1e-9))}
+
+
+def batching(boards):
+    """
+    Solver.solveMany against a loop of Solver.solve over the same boards. The batch gets the loop's worst case of
+    TIME_LIMIT per board as its timeout
+    """
+    start = time.perf_counter()
+    batched = Solver.solveMany(deepcopy(boards), len(boards) * TIME_LIMIT * 1000)
+    batchSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    solved = sum(1 for board in boards if Solver(deepcopy(board)).solve() != 0)
+    loopSeconds = time.perf_counter() - start
+    return {"boards": len(boards), "solveManySeconds": round(batchSeconds, 3),
+            "solveManySolved": sum(1 for pushes, _ in batched if pushes != 0), "solveSeconds": round(loopSeconds, 3),
+            "solveSolved": solved, "speedup": round(loopSeconds / max(batchSeconds, 1e-9), 2)}
+
+
+def memory(boards):
+    """Peak traced allocation of each solve in KiB. tracemalloc slows the search down, so this is its own pass"""
+    peaks = []
+    tracemalloc.start()
+    for board in boards:
+        solver = Solver(deepcopy(board))
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        solver.solve()
+        peaks.append((tracemalloc.get_traced_memory()[1] - base) / 1024)
+        del solver
+    tracemalloc.stop()
+    return {"peakKiB": percentiles(peaks), "maxKiB": round(max(peaks), 1)}
+
+
+def generating(size, difficulty=3, duration=10, seed=0):
+    """
+    Latency of utils.generateGameBoard calls and the boards per minute it accepts, then utils.generateNextBoard on
+    each accepted board
+    """
+    random.seed(seed)
+    prefilter.seed(seed)
+    utils.CACHE.clear()
+    calls = []
+    accepted = []
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        solver = utils.generateGameBoard(size, size, difficulty)
+        calls.append(time.perf_counter() - start)
+        if solver is not None:
+            accepted.append((solver.getBoard(), solver.getSolvedMoves()))
+    report = {"generateGameBoard": {"calls": len(calls), "accepted": len(accepted), "seconds": percentiles(calls),
+                                    "boardsPerMinute": round(len(accepted) * 60 / sum(calls), 1)}}
+    nexts = []
+    harder = 0
+    for board, moves in accepted[:20]:
+        start = time.perf_counter()
+        if utils.generateNextBoard(board, len(moves), time.monotonic() + TIME_LIMIT, moves) is not None:
+            harder += 1
+        nexts.append(time.perf_counter() - start)
+    report["generateNextBoard"] = {"calls": len(nexts), "accepted": harder, "seconds": percentiles(nexts)}
+    return report
+
+
+def creating(size, difficulty=3, duration=5, runs=5, seed=0):
+    """utils.createBest wall time, the pushes it reached and the search work summed over its solves"""
+    random.seed(seed)
+    prefilter.seed(seed)
+    utils.CACHE.clear()
+    seconds = []
+    pushes = []
+    stats = SolveStats()
+    for _ in range(runs):
+        start = time.perf_counter()
+        solver = utils.createBest(size, size, difficulty, duration, stats=stats)
+        seconds.append(time.perf_counter() - start)
+        if solver is not None:
+            pushes.append(len(solver.getSolvedMoves()))
+    return {"runs": runs, "accepted": len(pushes), "seconds": percentiles(seconds), "pushes": percentiles(pushes),
+            "boardsPerMinute": round(len(pushes) * 60 / sum(seconds), 1), "solves": stats.solves,
+            "nodesExpanded": stats.nodesExpanded}
+
+
+def pruning(boards):
+    """Solves every board with and without deadlock pruning and reports what the pruning removed"""
+    report = {}
+    for prune in (False, True):
+        pruned = visited = solved = 0
+        start = time.perf_counter()
+        for board in boards:
+            solver = Solver(deepcopy(board), prune=prune)
+            if solver.solve() != 0:
+                solved += 1
+            pruned += solver.pruned
+            visited += len(solver.visited)
+        report["pruned" if prune else "unpruned"] = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "solved": solved,
+            "layoutsVisited": visited,
+            "nodesPruned": pruned,
+        }
+    report["layoutsRemoved"] = report["unpruned"]["layoutsVisited"] - report["pruned"]["layoutsVisited"]
+    return report
+
+
+def acceptance(size, difficulty=3, accepted=5, seed=0):
+    """
+    Acceptance rate of solved candidates and wall time to the first accepted board, drawing candidates from
+    utils.randomBoard one at a time or from prefilter.nextCandidate batches
+    """
+    report = {}
+    for name, nextBoard in (("unfiltered", utils.randomBoard), ("prefiltered", prefilter.nextCandidate)):
+        random.seed(seed)
+        prefilter.seed(seed)
+        solved = found = 0
+        first = None
+        start = time.perf_counter()
+        while found < accepted:
+            board = nextBoard(size, size, difficulty)
+            if board is None:
+                continue
+            solved += 1
+            pushes = Solver(board).solve()
+            if pushes != 0 and pushes >= difficulty - 2:
+                found += 1
+                if first is None:
+                    first = time.perf_counter() - start
+        report[name] = {"solved": solved, "accepted": found, "acceptanceRate": round(found / solved, 3),
+                        "secondsToFirst": round(first, 3), "seconds": round(time.perf_counter() - start, 3)}
+    return report
+
+
+def generation(size, workers, count, duration=2):
+    """Boards per minute from BoardGenerator with the given number of worker processes"""
+    generator = BoardGenerator(workers)
+    # Let every worker finish spawning before the clock starts
+    generator.generate(size, size, 1, 0, workers)
+    start = time.perf_counter()
+    boards = len(generator.generate(size, size, 3, duration, count))
+    seconds = time.perf_counter() - start
+    generator.shutdown()
+    return {"workers": workers, "boards": boards, "seconds": round(seconds, 3),
+            "boardsPerMinute": round(boards * 60 / seconds, 1)}
+
+
+def compare(old, new, threshold, path=""):
+    """
+    Pairs up the numeric measurements of two runs
+    * @return [(path, old value, new value, relative change, regressed)], the change signed so that positive is worse
+    """
+    rows = []
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in old:
+            if key in new:
+                rows += compare(old[key], new[key], threshold, f"{path}.{key}" if path else key)
+    elif isinstance(old, list) and isinstance(new, list):
+        for i, (a, b) in enumerate(zip(old, new)):
+            rows += compare(a, b, threshold, f"{path}[{i}]")
+    elif isinstance(old, (int, float)) and isinstance(new, (int, float)) and not isinstance(old, bool):
+        change = (new - old) / abs(old) if old else float(new != 0)
+        if any(name in path for name in HIGHER_IS_BETTER):
+            change = -change
+        noise = "seconds" in path.lower() and max(old, new) < NOISE_SECONDS
+        rows.append((path, old, new, change, change > threshold and not noise))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--count", type=int, default=40, help="boards per size in the solve corpora")
+    parser.add_argument("--duration", type=int, default=10, help="seconds of generateGameBoard calls per size")
+    parser.add_argument("--generation", action="store_true", help="also time process pool board generation")
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved runs instead")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        rows = compare(old, new, args.threshold)
+        for path, before, after, change, regressed in rows:
+            print(f"{'REGRESSED' if regressed else 'ok':9} {path}: {before} -> {after} ({change:+.1%} cost)")
+        sys.exit(1 if any(row[4] for row in rows) else 0)
+
+    results = {}
+    for size in args.sizes:
+        boards = corpus(size, args.count)
+        results[f"{size}x{size}"] = {
+            "solve": {str(d): solving(candidates(size, d, max(1, args.count // len(DIFFICULTIES))))
+                      for d in DIFFICULTIES},
+            "batch": batching([board for d in DIFFICULTIES
+                               for board in candidates(size, d, max(1, args.count // len(DIFFICULTIES)))]),
+            "memory": memory(boards),
+            "pruning": pruning(boards),
+            "acceptance": acceptance(size),
+            "generate": generating(size, duration=args.duration),
+            "createBest": creating(size),
+        }
+    if args.generation:
+        cores = os.cpu_count() or 1
+        results["generation"] = [generation(6, workers, 4 * cores) for workers in sorted({1, cores})]
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Batch board generation and solving without a display or Qt. Boards are read and written as JSON lines of
+{"grid": [[0, 1, ...], ...], "pushes": N, "moves": [[x, y, offsetType], ...]}.
+
+    python cli.py generate WIDTH HEIGHT [--count N] [--difficulty D] [--duration SECONDS] [--pushes P] [--workers N]
+    python cli.py solve [FILE] [--timeout SECONDS] [--memory MIB]
+"""
+import argparse
+import json
+import sys
+import time
+
+import utils
+from solver import Solver
+
+
+def toRecord(solver) -> dict:
+    moves = solver.getSolvedMoves() or []
+    return {"grid": solver.getBoard(), "pushes": len(moves),
+            "moves": [[m.p.getX(), m.p.getY(), m.offsetType] for m in moves]}
+
+
+def generate(args):
+    """Boards from utils.createBest, utils.createPulled when --pushes is given, or a BoardGenerator pool"""
+    if args.workers:
+        from generator import BoardGenerator
+
+        generator = BoardGenerator(args.workers)
+        payloads = generator.generate(args.width, args.height, args.difficulty, args.duration, args.count)
+        generator.shutdown()
+        for payload in payloads:
+            yield toRecord(utils.solverFromPayload(payload))
+        return
+    for _ in range(args.count):
+        if args.pushes:
+            solver = utils.createPulled(args.width, args.height, args.pushes, args.duration, args.difficulty)
+        else:
+            solver = utils.createBest(args.width, args.height, args.difficulty, args.duration)
+        if solver is not None:
+            yield toRecord(solver)
+
+
+def solve(args):
+    for line in args.file:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        grid = record["grid"] if isinstance(record, dict) else record
+        memoryLimit = None if args.memory is None else args.memory * 2 ** 20
+        solver = Solver(grid, memoryLimit=memoryLimit, collectStats=memoryLimit is not None)
+        result = solver.solveWithin(time.monotonic() + args.timeout)
+        output = toRecord(solver)
+        output["status"] = result.status
+        if result.stats is not None:
+            output["spilledRecords"] = result.stats.spilledRecords
+            output["peakRss"] = result.stats.peakRss
+        yield output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    generateParser = commands.add_parser("generate", help="write generated boards")
+    generateParser.add_argument("width", type=int)
+    generateParser.add_argument("height", type=int)
+    generateParser.add_argument("--count", type=int, default=1)
+    generateParser.add_argument("--difficulty", type=int, default=3)
+    generateParser.add_argument("--duration", type=int, default=10, help="budget per board in seconds")
+    generateParser.add_argument("--pushes", type=int, default=None, help="exact pushes, made by pulling back")
+    generateParser.add_argument("--workers", type=int, default=None, help="generate in this many processes")
+    generateParser.set_defaults(run=generate)
+    solveParser = commands.add_parser("solve", help="solve boards read as JSON lines")
+    solveParser.add_argument("file", nargs="?", type=argparse.FileType("r"), default=sys.stdin)
+    solveParser.add_argument("--timeout", type=float, default=5, help="seconds per board")
+    solveParser.add_argument("--memory", type=int, default=None,
+                             help="MiB a solve may hold before spilling its search to disk")
+    solveParser.set_defaults(run=solve)
+    args = parser.parse_args()
+
+    for record in args.run(args):
+        print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
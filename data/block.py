@@ -1,21 +1,23 @@
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QBrush, QColor
-
-
 class Block:
-    BROWN = QBrush(QColor(191, 139, 6), Qt.SolidPattern)
-    YELLOW = QBrush(QColor(240, 195, 79), Qt.SolidPattern)
-    WHITE = QBrush(Qt.white, Qt.SolidPattern)
-    RED = QBrush(Qt.red, Qt.SolidPattern)
-    id = 0
+    """
+    A boulder on the play grid. Colors are plain RGB tuples so the puzzle core runs without Qt, the rendering layer
+    turns them into brushes. Boulders only differ by color, so every grid shares the two instances from Block.of
+    """
+    BROWN = (191, 139, 6)
+    YELLOW = (240, 195, 79)
+    WHITE = (255, 255, 255)
+    RED = (255, 0, 0)
 
-    def __init__(self):
-        self._blockColor = Block.BROWN if Block.id % 2 == 1 else Block.YELLOW
-        Block.id += 1
+    def __init__(self, color: tuple):
+        self._blockColor = color
 
-    def getColor(self):
+    def getColor(self) -> tuple:
         return self._blockColor
 
     @staticmethod
-    def resetId():
-        Block.id = 0
+    def of(index: int) -> "Block":
+        """The shared block for a board's index-th boulder, counted row by row, so neighbours alternate colors"""
+        return _SHARED[index % 2]
+
+
+_SHARED = (Block(Block.YELLOW), Block(Block.BROWN))
@@ -1,7 +1,10 @@
+import itertools
 from copy import deepcopy
 
 import utils
 from data.block import Block
+from data.move import STEPS, Move
+from data.point import Point
 from solver import Solver
 
 
@@ -14,17 +17,64 @@ class Board:
         if self._moveList is None:
             return
         self._moves = len(self._moveList)
-        Block.resetId()
-        self._board: [[Block]] = [[Block() if self._grid[x][y] == 1 else None for y in range(len(self._grid[0]))] for x
-                                  in
-                                  range(len(self._grid))]
+        blocks = itertools.count()
+        # The starting position, never modified, reset copies it back into the play grid
+        self._start = tuple(tuple(Block.of(next(blocks)) if val == 1 else None for val in row) for row in self._grid)
+        self._board: [[Block]] = [list(row) for row in self._start]
+        # (x, y, offsetType) of every push made, the player's cell before it
+        self._log = []
         self._currentMoves = 0
+        # Pushes made since the last reset, undone ones included, so undo cannot earn the fewest-pushes bonus
+        self._totalMoves = 0
         self._startTime = 0
 
-    def regenerateMap(self):
-        self._board = [[Block() if self._grid[x][y] == 1 else None for y in range(len(self._grid[0]))] for x in
-                       range(len(self._grid))]
+    def move(self, player: Point, offsetType: int) -> bool:
+        """
+         * Solver.attemptMove on the play grid, logging the push if one was made
+         * @return whether a boulder was pushed
+         """
+        x = player.getX()
+        y = player.getY()
+        if not Solver.attemptMove(player, offsetType, self._board):
+            return False
+        self._log.append((x, y, offsetType))
+        self._currentMoves += 1
+        self._totalMoves += 1
+        return True
+
+    def undo(self):
+        """
+         * Takes back the last push
+         * @return the undone push, with p at the player's cell before it, or None if nothing was pushed
+         """
+        if not self._log:
+            return None
+        x, y, offsetType = self._log.pop()
+        dx, dy = STEPS[offsetType]
+        self._board[x + dx][y + dy] = self._board[x + 2 * dx][y + 2 * dy]
+        self._board[x + 2 * dx][y + 2 * dy] = None
+        self._currentMoves -= 1
+        move = Move()
+        move.p = Point(x, y)
+        move.offsetType = offsetType
+        return move
+
+    def reset(self) -> set:
+        """
+         * Puts every boulder back in place, in the same grid lists getBoard returned
+         * @return (x, y) of the cells the pushes since the last reset moved a boulder into or out of
+         """
+        cells = set()
+        for x, y, offsetType in self._log:
+            dx, dy = STEPS[offsetType]
+            cells.add((x + dx, y + dy))
+            cells.add((x + 2 * dx, y + 2 * dy))
+        for row, start in zip(self._board, self._start):
+            row[:] = start
+        self._log.clear()
         self._currentMoves = 0
+        self._totalMoves = 0
+        return cells
 
     def setStartTime(self):
         self._startTime = utils.getMillis()
@@ -38,8 +88,12 @@ class Board:
     def getCurrentMoves(self):
         return self._currentMoves
 
-    def incrMoves(self):
-        self._currentMoves += 1
+    def getTotalMoves(self):
+        return self._totalMoves
+
+    def tookFewestPushes(self) -> bool:
+        """Whether the pushes made since the last reset, undone ones included, were no more than the solution's"""
+        return self._totalMoves <= self._moves
 
     def getStartTime(self):
         return self._startTime
@@ -0,0 +1,18 @@
+import threading
+
+
+class CancelToken:
+    """
+    Stop flag shared with a running search. Wraps anything with set() and is_set(), by default a threading.Event.
+    A multiprocessing manager Event lets another process cancel the search.
+    """
+    __slots__ = ("_event",)
+
+    def __init__(self, event=None):
+        self._event = threading.Event() if event is None else event
+
+    def cancel(self):
+        self._event.set()
+
+    def isCancelled(self) -> bool:
+        return self._event.is_set()
@@ -1,3 +1,7 @@
+# Grid step (x, y) of each offsetType
+STEPS = {1: (-1, 0), 2: (1, 0), 3: (0, -1), 4: (0, 1)}
+
+
 class Move:
     def __init__(self):
         self.p = None
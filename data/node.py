@@ -0,0 +1,28 @@
+import collections
+
+
+class Node:
+    """
+    Search state that links back to its parent instead of copying the move list. Packed searches store the
+    player's reachable region as a bitmask in player, grid searches store the player's Point.
+    """
+    __slots__ = ("grid", "player", "parent", "move", "moves", "code")
+
+    def __init__(self, grid, player, parent=None, move=None):
+        self.grid = grid
+        self.player = player
+        self.parent = parent
+        self.move = move
+        self.moves = 0 if parent is None else parent.moves + 1
+        self.code = 0
+
+    def getMoveList(self) -> collections.deque:
+        moveList = collections.deque()
+        node = self
+        while node.move is not None:
+            moveList.appendleft(node.move)
+            node = node.parent
+        return moveList
+
+    def __str__(self):
+        return "Node{Player=" + str(self.player) + ", Moves=" + str(self.moves) + "}"
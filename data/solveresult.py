@@ -0,0 +1,23 @@
+class SolveResult:
+    """Outcome of Solver.solveWithin: how the search ended and the best solution it found, if any"""
+    OPTIMAL = "optimal"
+    BEST = "best"
+    TIMED_OUT = "timed out"
+    CANCELLED = "cancelled"
+    UNSOLVABLE = "unsolvable"
+
+    __slots__ = ("status", "pushes", "moves", "stats")
+
+    def __init__(self, status: str, pushes: int = 0, moves=None):
+        self.status = status
+        self.pushes = pushes
+        self.moves = moves
+        # data.solvestats.SolveStats when the solver collects them, otherwise None
+        self.stats = None
+
+    def isSolved(self) -> bool:
+        """OPTIMAL is proven shortest, BEST is the shortest found before the search was stopped"""
+        return self.status == SolveResult.OPTIMAL or self.status == SolveResult.BEST
+
+    def __str__(self):
+        return "SolveResult{Status=" + self.status + ", Pushes=" + str(self.pushes) + "}"
@@ -0,0 +1,94 @@
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows has no resource module, peakRss() reports 0 there
+    resource = None
+
+
+class SolveStats:
+    """
+    Counters for one solve, or the sum of several with add(). Solver.solveWithin only fills them in when the
+    solver's collectStats is set.
+    """
+    __slots__ = ("solves", "cacheHits", "nodesExpanded", "peakFrontier", "visitedSize", "duplicates",
+                 "pushesGenerated", "floodCells", "seconds", "hashSeconds", "spilledRecords", "peakRss")
+
+    def __init__(self):
+        self.solves = 0
+        self.cacheHits = 0
+        self.nodesExpanded = 0
+        self.peakFrontier = 0
+        self.visitedSize = 0
+        self.duplicates = 0
+        self.pushesGenerated = 0
+        # Cells of every player region flood filled, a measure of the time spent walking
+        self.floodCells = 0
+        self.seconds = 0.0
+        # Time in visited set lookups and updates, the rest of seconds is expansion
+        self.hashSeconds = 0.0
+        # States Solver._solveExternal wrote to disk
+        self.spilledRecords = 0
+        # The process' peak resident set size in bytes when the solve ended, see peakRss()
+        self.peakRss = 0
+
+    def add(self, other):
+        for name in SolveStats.__slots__:
+            if name == "peakFrontier" or name == "peakRss":
+                setattr(self, name, max(getattr(self, name), getattr(other, name)))
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def expandSeconds(self) -> float:
+        return self.seconds - self.hashSeconds
+
+    def toDict(self) -> dict:
+        values = {name: getattr(self, name) for name in SolveStats.__slots__}
+        values["expandSeconds"] = self.expandSeconds()
+        return values
+
+    def __str__(self):
+        return "SolveStats{" + ", ".join(f"{k}={v}" for k, v in self.toDict().items()) + "}"
+
+
+class TimedDict(dict):
+    """Visited map for solves with stats, adds the time of each lookup and update to stats.hashSeconds"""
+
+    def __init__(self, stats: SolveStats, *args):
+        super().__init__(*args)
+        self.stats = stats
+
+    def get(self, key, default=None):
+        began = time.perf_counter()
+        value = super().get(key, default)
+        self.stats.hashSeconds += time.perf_counter() - began
+        return value
+
+    def __getitem__(self, key):
+        began = time.perf_counter()
+        value = super().__getitem__(key)
+        self.stats.hashSeconds += time.perf_counter() - began
+        return value
+
+    def __setitem__(self, key, value):
+        began = time.perf_counter()
+        super().__setitem__(key, value)
+        self.stats.hashSeconds += time.perf_counter() - began
+
+    def setdefault(self, key, default=None):
+        began = time.perf_counter()
+        value = super().setdefault(key, default)
+        self.stats.hashSeconds += time.perf_counter() - began
+        return value
+
+
+def peakRss() -> int:
+    """Peak resident set size of this process so far in bytes, 0 where it can't be read"""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss if sys.platform == "darwin" else rss * 1024
@@ -0,0 +1,113 @@
+"""
+Sorted files of fixed size records, for searches whose state sets outgrow memory. Records are bytes compared as
+plain byte strings, so a state written big-endian sorts the same on disk as in memory. A record may end in a
+payload that duplicates ignore: only the first keySize bytes make two records equal.
+"""
+import heapq
+import os
+import tempfile
+
+# Records read or written per file call
+CHUNK = 4096
+# Runs merged at once, each holds an open file while it is merged
+FAN_IN = 64
+
+
+class RunFile:
+    """One sorted run on disk. Iterating it streams the records back without loading the file"""
+
+    def __init__(self, path: str, size: int, count: int):
+        self.path = path
+        self.size = size
+        self.count = count
+
+    @staticmethod
+    def write(directory: str, records, size: int) -> "RunFile":
+        """
+         * @param directory - where the file is made, None for the system temporary directory
+         * @param records - records of size bytes, already in sorted order
+         """
+        handle, path = tempfile.mkstemp(prefix="run-", suffix=".bin", dir=directory)
+        count = 0
+        with os.fdopen(handle, "wb") as file:
+            chunk = []
+            for record in records:
+                chunk.append(record)
+                if len(chunk) == CHUNK:
+                    file.write(b"".join(chunk))
+                    count += len(chunk)
+                    chunk.clear()
+            file.write(b"".join(chunk))
+            count += len(chunk)
+        return RunFile(path, size, count)
+
+    @staticmethod
+    def merge(directory: str, runs: list, keySize: int) -> "RunFile":
+        """Merges runs into one run without duplicate keys, and removes them"""
+        merged = RunFile.write(directory, unique(runs, keySize), runs[0].size)
+        for run in runs:
+            run.remove()
+        return merged
+
+    def __iter__(self):
+        with open(self.path, "rb") as file:
+            while True:
+                block = file.read(self.size * CHUNK)
+                if not block:
+                    return
+                for start in range(0, len(block), self.size):
+                    yield block[start:start + self.size]
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key: bytes):
+        """
+         * Binary search with one seek per step
+         * @return the first record starting with key, or None
+         """
+        low = 0
+        high = self.count
+        with open(self.path, "rb") as file:
+            while low < high:
+                middle = (low + high) // 2
+                file.seek(middle * self.size)
+                if file.read(len(key)) < key:
+                    low = middle + 1
+                else:
+                    high = middle
+            if low == self.count:
+                return None
+            file.seek(low * self.size)
+            record = file.read(self.size)
+        return record if record.startswith(key) else None
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def unique(runs, keySize: int):
+    """Merges sorted runs into one sorted stream, keeping the first record of each key"""
+    last = None
+    for record in heapq.merge(*runs):
+        key = record[:keySize]
+        if key != last:
+            last = key
+            yield record
+
+
+def subtract(records, seen, keySize: int):
+    """
+     * @param records - sorted records, unique by key
+     * @param seen - sorted records, may repeat keys
+     * @return the records whose key is not in seen, in order
+     """
+    seen = iter(seen)
+    other = next(seen, None)
+    for record in records:
+        key = record[:keySize]
+        while other is not None and other[:keySize] < key:
+            other = next(seen, None)
+        if other is None or other[:keySize] != key:
+            yield record
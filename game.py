@@ -1,17 +1,34 @@
 import collections
 import sys
+from functools import lru_cache
 
 from PyQt5 import QtWidgets, QtGui
-from PyQt5.QtCore import Qt, QRect, pyqtSlot, QThreadPool, QRunnable, QTimer, \
-    QCoreApplication
-from PyQt5.QtGui import QPainter, QBrush, QColor, QPalette
+from PyQt5.QtCore import Qt, QRect, pyqtSlot, pyqtSignal, QObject, QTimer, QCoreApplication
+from PyQt5.QtGui import QPainter, QBrush, QColor, QPalette, QPixmap, QPainterPath
 from PyQt5.QtWidgets import QMainWindow, QPushButton
 
 import utils
+from bank import CACHE_FILE, PuzzleBank
 from data.block import Block
 from data.board import Board
+from data.move import STEPS
 from data.point import Point
-from solver import Solver
+from generator import BoardGenerator
+from hint import HintEngine
+from scheduler import BoardScheduler
+
+
+@lru_cache(maxsize=None)
+def brush(color: tuple) -> QBrush:
+    """The brush for a data.block RGB color, made on first use"""
+    return QBrush(QColor(*color), Qt.SolidPattern)
+
+
+class Signals(QObject):
+    # Emitted from the generator's threads when a job finishes, delivered on the GUI thread
+    boardReady = pyqtSignal()
+    # Emitted from the hint thread when a hint is found or given up on
+    hintReady = pyqtSignal()
 
 
 class Canvas(QMainWindow):
@@ -25,6 +42,10 @@ class Canvas(QMainWindow):
         self.leftMargin = 0
         self.rightMargin = self.width - 120
         self.buttonsHidden = True
+        self._buttonsShown = None
+        self._hiddenPalette = QPalette(Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
+                                       Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
+                                       Qt.transparent)
         self._initUI()
 
     def _initUI(self):
@@ -36,7 +57,7 @@ class Canvas(QMainWindow):
                 return
             self.game.createNewGame()
             self.game.decreaseScore()
-            self.repaint()
+            self.game.invalidate()
 
         @pyqtSlot()
         def showMoves():
@@ -45,7 +66,7 @@ class Canvas(QMainWindow):
             self.game.decreaseScore(1)
             self.game.toggleShowMoves()
             self.hideButton(2)
-            self.repaint()
+            self.game.invalidate()
 
         @pyqtSlot()
         def showSolution():
@@ -54,7 +75,7 @@ class Canvas(QMainWindow):
             self.game.showSolution()
             self.game.decreaseScore(4)
             self.hideButton(3)
-            self.repaint()
+            self.game.invalidate()
 
         self._newButton = QPushButton("New Board", self)
         self._newButton.setToolTip("Creates a new board (if unsolvable or too difficult) (-2 points)")
@@ -62,7 +83,7 @@ class Canvas(QMainWindow):
         self._newButton.visible = False
 
         self._resetButton = QPushButton("Reset Map (R)", self)
-        self._resetButton.clicked.connect(self.game.resetMap)
+        self._resetButton.clicked.connect(lambda: self.game.resetMap() or self.game.invalidate())
         self._resetButton.visible = False
 
         self._showMoves = QPushButton("Show Moves Needed", self)
@@ -72,13 +93,13 @@ class Canvas(QMainWindow):
         self._showMoves.visible = False
 
         self._showSolution = QPushButton("Show Solution", self)
-        self._showSolution.setToolTip("Displays solution for puzzle (-4 points)")
+        self._showSolution.setToolTip("Displays the best pushes from where you stand (-4 points)")
         self._showSolution.clicked.connect(showSolution)
         self._showSolution.visible = False
 
         self._showHelp = QPushButton("Help", self)
         self._showHelp.setToolTip("Displays the tutorial again.")
-        self._showHelp.clicked.connect(self.game.showHelp)
+        self._showHelp.clicked.connect(lambda: self.game.showHelp() or self.game.invalidate())
         self._showHelp.visible = False
 
         self.moveButtons()
@@ -108,9 +129,7 @@ class Canvas(QMainWindow):
         button.setFlat(False)
 
     def hideButton(self, index):
-        palette = QPalette(Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
-                           Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
-                           Qt.transparent)
+        palette = self._hiddenPalette
         if index == 0:
             button = self._newButton
         elif index == 1:
@@ -125,9 +144,11 @@ class Canvas(QMainWindow):
         button.setFlat(True)
 
     def showButtons(self, show: bool):
-        palette = QPalette() if show else QPalette(Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
-                                                   Qt.transparent, Qt.transparent, Qt.transparent, Qt.transparent,
-                                                   Qt.transparent)
+        # paint asks for the same state on every frame it stays hidden
+        if show == self._buttonsShown:
+            return
+        self._buttonsShown = show
+        palette = QPalette() if show else self._hiddenPalette
         self._newButton.setPalette(palette)
         self._resetButton.setPalette(palette)
         self._showMoves.setPalette(palette)
@@ -142,6 +163,7 @@ class Canvas(QMainWindow):
 
     def keyPressEvent(self, e: QtGui.QKeyEvent) -> None:
         self.game.handleMoves(e)
+        self.game.invalidate()
 
     def paintEvent(self, a0: QtGui.QPaintEvent) -> None:
         painter = QPainter()
@@ -169,30 +191,69 @@ class Game:
         self._showMoves = False
         self._showSolution = False
         self._gameOver = False
-        self._calculating = False
-        self._generatingMulti = False
         self._player = None
+        # The board's cells drawn once, (squareSize, rows, cols) it was drawn for, and cells changed since
+        self._boardPixmap = None
+        self._pixmapKey = None
+        self._dirtyCells = set()
+        # One arrow per move of _arrowMoves for the square size in _arrowSize, and (move number, arrows after it)
+        self._arrows = None
+        self._arrowMoves = None
+        self._arrowSize = None
+        self._remainingArrows = None
+        # HintEngine.hint for the player's position, asked again only after a push, undo, reset, new board or
+        # finished search, since walking keeps the player in the same region
+        self._hint = None
         self._games = collections.deque()
+        self._bank = PuzzleBank()
 
         self._app = QtWidgets.QApplication(sys.argv)
         self._canvas = Canvas(self)
+        self._signals = Signals()
+        self._signals.boardReady.connect(self.invalidate, Qt.QueuedConnection)
+        self._scheduler = BoardScheduler(BoardGenerator(cachePath=CACHE_FILE), rows, cols,
+                                         onDone=self._signals.boardReady.emit)
+        self._signals.hintReady.connect(self._hintReady, Qt.QueuedConnection)
+        self._hints = HintEngine(onDone=self._signals.hintReady.emit)
+        self._congratulationTimer = QTimer()
+        self._congratulationTimer.setSingleShot(True)
+        self._congratulationTimer.setInterval(5_000)
+        self._congratulationTimer.timeout.connect(self._endCongratulation)
 
     def start(self):
         self._canvas.show()
-        self._canvas.repaint()
-
-        def tick():
-            self._canvas.repaint()
-            self._generateBoards()
-            self._handleLogic()
-
-        timer = QTimer()
-        timer.timeout.connect(tick)
-        timer.setInterval(50)
-        timer.start()
+        self.invalidate()
 
         QCoreApplication.quit()
-        sys.exit(self._app.exec_())
+        code = self._app.exec_()
+        self._hints.shutdown()
+        self._scheduler.shutdown()
+        self._bank.close()
+        sys.exit(code)
+
+    def invalidate(self):
+        """
+        Brings the game up to date after anything changed, a key, a button, a finished board or a timer, and
+        schedules one coalesced repaint. Nothing is redrawn or polled otherwise.
+        """
+        self._generateBoards()
+        self._handleLogic()
+        self._canvas.update()
+
+    def _hintReady(self):
+        self._refreshHint()
+        self.invalidate()
+
+    def _refreshHint(self):
+        """Looks up the hint for the player's position, starting a search for it when the solution is shown"""
+        if self._showSolution and self._player is not None and self._game is not None:
+            self._hint = self._hints.hint(self._game, self._player)
+        else:
+            self._hint = None
+
+    def _endCongratulation(self):
+        self._congratulationTicks = 0
+        self.invalidate()
 
     def handleMoves(self, e: QtGui.QKeyEvent):
         if self._gameOver:
@@ -216,9 +277,10 @@ class Game:
             if self._player.getX() == 0:
                 self._player = None
                 self._congratulationTicks = 100
-                if self._board.getCurrentMoves() == self._board.getMoves():
+                self._congratulationTimer.start()
+                if self._board.tookFewestPushes():
                     self._score += 1
-                self._movesTaken = f"Moves Needed: {self._board.getMoves()}. Moves Taken: {self._board.getCurrentMoves()}"
+                self._movesTaken = f"Moves Needed: {self._board.getMoves()}. Moves Taken: {self._board.getTotalMoves()}"
                 time = utils.getMillis() - self._board.getStartTime()
                 if time < 20_000:
                     self._score += 1
@@ -235,14 +297,19 @@ class Game:
         if key == Qt.Key_R:
             self.resetMap()
             return
+        if key == Qt.Key_Z:
+            self.undo()
+            return
 
         if offsetType != 0:
             if self._board is None:
                 return
-            if Solver.attemptMove(self._player, offsetType, self._game):
-                self._board.incrMoves()
-                if self._board.getCurrentMoves() == 1:
-                    self._canvas.hideButton(3)
+            if self._board.move(self._player, offsetType):
+                # A push moves the block from the player's new cell to the next one, walking changes no cells
+                dx, dy = STEPS[offsetType]
+                self._dirtyCells.add((self._player.getX(), self._player.getY()))
+                self._dirtyCells.add((self._player.getX() + dx, self._player.getY() + dy))
+                self._refreshHint()
             # self._canvas.repaint()
 
     def _handleLogic(self):
@@ -251,85 +318,64 @@ class Game:
             # self._canvas.repaint()
 
     def _generateBoards(self):
+        self._collectBoards()
         if self._board is None:
             if len(self._games) == 0:
-                if not self._generatingMulti and not self._calculating:
-                    self._calculating = True
-
-                    def backgroundCreate():
-                        best = utils.createBest(self._rows, self._cols, 3, 10)
-                        if best is not None:
-                            self._board = Board(best)
-                            self._game = self._board.getBoard()
-                            self._board.setStartTime()
-                            self._showMoves = False
-                            self._showSolution = False
-                            self._player = Point(len(self._game) - 1, 0)
-                        self._calculating = False
-                        # # self._canvas.repaint()
-
-                    # # # self._canvas.repaint() <- something..
-
-                    # threading.Thread(target=backgroundCreate).start()
-                    class Runnable(QRunnable):
-                        def __init__(self):
-                            super().__init__()
-
-                        def run(self):
-                            backgroundCreate()
-
-                    threadCount = QThreadPool.globalInstance().maxThreadCount()
-                    pool = QThreadPool.globalInstance()
-                    if threadCount > 0:
-                        runnable = Runnable()
-                        pool.start(runnable)
-                    # Multithreading?
+                payload = self._bank.random(self._rows, self._cols)
+                if payload is not None:
+                    self._games.append(Board(utils.solverFromPayload(payload)))
+            if len(self._games) == 0:
+                # Nothing to play, so a board with the shorter time budget goes ahead of the refills
+                self._scheduler.requestUrgent()
             else:
                 self._board: Board = self._games.pop()
-                self._calculating = False
                 self._game = self._board.getBoard()
+                self._boardPixmap = None
+                self._hints.clear()
+                # The board's own solution answers every position along it without a search
+                self._hints.learn(self._game, self._board.getMoveList())
                 self._board.setStartTime()
+                self._scheduler.boardTaken()
                 self._showSolution = self._showMoves = False
                 self._player = Point(len(self._game) - 1, 0)
+                self._refreshHint()
                 # self._canvas.repaint()
-        else:
-            if len(self._games) < 2:
-                if not self._generatingMulti:
-                    self._generatingMulti = True
-
-                    def multiCreate():
-                        while self._generatingMulti:
-                            best = utils.createBest(self._rows, self._cols, 3, 30)
-                            if best is not None:
-                                self._games.append(Board(best))
-
-                    class Runnable(QRunnable):
-                        def __init__(self):
-                            super().__init__()
-
-                        def run(self):
-                            multiCreate()
-
-                    threadCount = QThreadPool.globalInstance().maxThreadCount()
-                    pool = QThreadPool.globalInstance()
-                    if threadCount > 0:
-                        runnable = Runnable()
-                        pool.start(runnable)
-            else:
-                self._generatingMulti = False
-            self._calculating = False
+        self._scheduler.refill(len(self._games))
+
+    def _collectBoards(self):
+        """Turns finished worker payloads into boards on the GUI thread"""
+        for payload in self._scheduler.collect():
+            # Live boards also top up the bank for later sessions
+            self._bank.add(payload)
+            self._games.append(Board(utils.solverFromPayload(payload)))
 
     def resetMap(self):
-        Block.resetId()
         if self._board is not None:
-            self._board.regenerateMap()
-            self._game = self._board.getBoard()
+            # Only the cells the pushes touched are redrawn, the board pixmap is kept
+            self._dirtyCells |= self._board.reset()
             self._showSolution = False
             self._score -= 1
             self._canvas.showButton(3)
         self._player = Point(len(self._game) - 1, 0)
+        self._refreshHint()
         # self._canvas.repaint()
 
+    def undo(self):
+        """Takes back the last push and puts the player where they pushed it from"""
+        if self._board is None or self._player is None:
+            return
+        move = self._board.undo()
+        if move is None:
+            return
+        if self._board.getCurrentMoves() == 0:
+            # Taking back every push is a reset, so it costs what resetMap does
+            self._score -= 1
+        self._player = move.p
+        dx, dy = STEPS[move.offsetType]
+        self._dirtyCells.add((move.p.getX() + dx, move.p.getY() + dy))
+        self._dirtyCells.add((move.p.getX() + 2 * dx, move.p.getY() + 2 * dy))
+        self._refreshHint()
+
     def restart(self):
         self._score = 10
         self._solved = 0
@@ -340,6 +386,7 @@ class Game:
         self._showMoves = False
         self._showSolution = False
         self._gameOver = False
+        self._hint = None
 
     def createNewGame(self):
         self._game = None
@@ -413,64 +460,27 @@ class Game:
         if rightMargin != self._canvas.rightMargin:
             self._canvas.rightMargin = rightMargin
             self._canvas.moveButtons()
-        for i in range(hlength):
-            for j in range(vlength):
-                block: Block = self._game[j][i]
-                if block is not None:
-                    painter.setBrush(block.getColor())
-                else:
-                    painter.setBrush(Block.WHITE)
-                painter.drawRect(self._canvas.leftMargin + i * squareSize, topMargin + j * squareSize, squareSize,
-                                 squareSize)
+        self._updateBoardPixmap(squareSize)
+        painter.drawPixmap(self._canvas.leftMargin, topMargin, self._boardPixmap)
 
         if self._player is not None:
-            painter.setBrush(Block.RED)
-            painter.drawRect(self._canvas.leftMargin + self._player.getY() * squareSize + squareSize / 4,
-                             topMargin + self._player.getX() * squareSize + squareSize / 4, squareSize / 2,
-                             squareSize / 2)
-
-        if self._showSolution:
-            counter = 0
-            for move in self._board.getMoveList():
-                if self._board.getCurrentMoves() > counter:
-                    counter += 1
-                    continue
-                counter += 1
-
-                x = int(move.p.getY() * squareSize + self._canvas.leftMargin + squareSize / 2)
-                y = int(move.p.getX() * squareSize + topMargin + squareSize / 2)
-                x2 = x
-                y2 = y
-                offsetType = move.offsetType
-                if offsetType == 1:
-                    y2 += squareSize
-                elif offsetType == 2:
-                    y2 -= squareSize
-                elif offsetType == 3:
-                    x2 += squareSize
-                elif offsetType == 4:
-                    x2 -= squareSize
-                if counter - 1 == self._board.getCurrentMoves():
-                    painter.setPen(Qt.green)
-                    painter.setBrush(QBrush(Qt.green, Qt.SolidPattern))
-                else:
-                    painter.setPen(Qt.red)
-                    painter.setBrush(Block.RED)
-                painter.drawLine(x, y, x2, y2)
-
-                painter.translate(x, y)
-                theta = 0
-                if offsetType == 3:
-                    theta = 180
-                elif offsetType == 1:
-                    theta = 270
-                elif offsetType == 2:
-                    theta = 90
-                painter.rotate(theta)
-                painter.drawLine(-squareSize / 3, -squareSize / 3, 0, 0)
-                painter.drawLine(-squareSize / 3, squareSize / 3, 0, 0)
-                painter.rotate(-theta)
-                painter.translate(-x, -y)
+            painter.setBrush(brush(Block.RED))
+            painter.drawRect(self._canvas.leftMargin + self._player.getY() * squareSize + squareSize // 4,
+                             topMargin + self._player.getX() * squareSize + squareSize // 4, squareSize // 2,
+                             squareSize // 2)
+
+        overlay = self._solutionArrows(squareSize) if self._showSolution else None
+        if overlay is not None:
+            arrows, current, remaining = overlay
+            painter.save()
+            painter.translate(self._canvas.leftMargin, topMargin)
+            painter.setBrush(Qt.NoBrush)
+            if current < len(arrows):
+                painter.setPen(Qt.green)
+                painter.drawPath(arrows[current])
+            painter.setPen(Qt.red)
+            painter.drawPath(remaining)
+            painter.restore()
 
         font = painter.font()
         font.setPixelSize(12)
@@ -484,8 +494,72 @@ class Game:
                                    left=self._canvas.rightMargin + 5,
                                    right=self._canvas.width - 10 - self._canvas.rightMargin)
 
+    def _updateBoardPixmap(self, squareSize):
+        """
+         * Redraws the whole board into the pixmap after a new board, a reset or a resize, otherwise only the cells a
+         * push changed. The player and the solution are drawn over it on every frame
+         """
+        rows = len(self._game)
+        cols = len(self._game[0])
+        key = (squareSize, rows, cols)
+        if self._boardPixmap is None or key != self._pixmapKey:
+            # One extra pixel for the outline of the last row and column
+            self._boardPixmap = QPixmap(cols * squareSize + 1, rows * squareSize + 1)
+            self._boardPixmap.fill(Qt.transparent)
+            self._pixmapKey = key
+            cells = [(x, y) for x in range(rows) for y in range(cols)]
+        else:
+            cells = [(x, y) for x, y in self._dirtyCells if 0 <= x < rows and 0 <= y < cols]
+        self._dirtyCells.clear()
+        if not cells:
+            return
+        painter = QPainter(self._boardPixmap)
+        for x, y in cells:
+            block: Block = self._game[x][y]
+            painter.setBrush(brush(Block.WHITE if block is None else block.getColor()))
+            painter.drawRect(y * squareSize, x * squareSize, squareSize, squareSize)
+        painter.end()
+
+    def _solutionArrows(self, squareSize):
+        """
+         * The overlay for the player's position in board coordinates. The arrows are built once per solution and
+         * square size, and following a solution reuses them push after push
+         * @return (an arrow per move, the next move's index, one path with every arrow after it), or None while the
+         *         hint is searched for or when there is none
+         """
+        found = None if self._player is None else self._hint
+        if found is None or found[0] is None:
+            return None
+        moves, current = found
+        if self._arrows is None or self._arrowMoves is not moves or self._arrowSize != squareSize:
+            self._arrows = [Game._arrow(move, squareSize) for move in moves]
+            self._arrowMoves = moves
+            self._arrowSize = squareSize
+            self._remainingArrows = None
+        # Rebuilt once per push instead of once per frame
+        if self._remainingArrows is None or self._remainingArrows[0] != current:
+            remaining = QPainterPath()
+            for arrow in self._arrows[current + 1:]:
+                remaining.addPath(arrow)
+            self._remainingArrows = (current, remaining)
+        return self._arrows, current, self._remainingArrows[1]
+
+    @staticmethod
+    def _arrow(move, squareSize) -> QPainterPath:
+        """A line from the pushing player's cell to the block, with the head on the block pointing the push's way"""
+        dy, dx = STEPS[move.offsetType]
+        x = move.p.getY() * squareSize + squareSize / 2
+        y = move.p.getX() * squareSize + squareSize / 2
+        head = squareSize / 3
+        path = QPainterPath()
+        path.moveTo(x, y)
+        path.lineTo(x - dx * squareSize, y - dy * squareSize)
+        for side in (-1, 1):
+            path.moveTo(x - dx * head - side * dy * head, y - dy * head + side * dx * head)
+            path.lineTo(x, y)
+        return path
+
     def _drawCongratulation(self, painter):  # drawText method
-        self._congratulationTicks -= 1
         font = painter.font()
         font.setPixelSize(32)
         painter.setFont(font)
@@ -516,7 +590,7 @@ class Game:
             #     # g.setColor(new Color(50, 158, 168).darker());
             painter.drawCenteredString("Click any letter key to continue", 4 * self._canvas.height / 5)
         elif self._showHelp == 4:
-            painter.drawCenteredString("You may use WASD to move", self._canvas.height / 3)
+            painter.drawCenteredString("You may use WASD to move, and Z to undo a push", self._canvas.height / 3)
             painter.drawCenteredString("..but you can only push 1 boulder at a time", 2 * self._canvas.height / 3)
             #     # g.setColor(new Color(50, 158, 168).darker());
             painter.drawCenteredString("Click any letter key to continue", 4 * self._canvas.height / 5)
@@ -562,6 +636,7 @@ class Game:
 
     def showSolution(self):
         self._showSolution = True
+        self._refreshHint()
 
     def showHelp(self):
         self._showHelp = 1
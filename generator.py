@@ -0,0 +1,62 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+import utils
+from data.canceltoken import CancelToken
+
+
+class BoardGenerator:
+    """
+    Runs utils.createBest in a pool of worker processes, one per core by default, so generation is not serialized
+    by the GIL or competing with the UI thread. Workers return utils.createBestPayload tuples, which are turned
+    back into solvers with utils.solverFromPayload. Every job gets a CancelToken backed by a manager Event, so
+    cancel() stops a running job instead of leaving it to use up its time budget.
+    """
+
+    def __init__(self, workers: int = None, cachePath: str = None):
+        """
+         * @param workers - worker processes, one per core by default
+         * @param cachePath - solve cache file the workers load at startup and add to, see utils.persistCache
+         """
+        self._workers = workers or os.cpu_count() or 1
+        # Forking a running Qt application is not safe. Spawned workers re-run the main script, so they only import
+        # the puzzle core while it imports Qt under its __main__ guard, as main.py does
+        context = multiprocessing.get_context("spawn")
+        initializer = None if cachePath is None else utils.persistCache
+        self._pool = concurrent.futures.ProcessPoolExecutor(self._workers, mp_context=context, initializer=initializer,
+                                                            initargs=() if cachePath is None else (cachePath,))
+        self._manager = context.Manager()
+        self._tokens = {}
+
+    def getWorkers(self) -> int:
+        return self._workers
+
+    def submit(self, width, height, diff, duration) -> concurrent.futures.Future:
+        token = CancelToken(self._manager.Event())
+        future = self._pool.submit(utils.createBestPayload, width, height, diff, duration, token)
+        self._tokens[future] = token
+        future.add_done_callback(self._forget)
+        return future
+
+    def cancel(self, future: concurrent.futures.Future):
+        """Drops a queued job, or makes a running one give up and return None at its next check"""
+        if not future.cancel():
+            token = self._tokens.get(future)
+            if token is not None:
+                token.cancel()
+
+    def generate(self, width, height, diff, duration, count) -> list:
+        """Blocks until count boards were attempted and returns the payloads that were created"""
+        futures = [self.submit(width, height, diff, duration) for _ in range(count)]
+        payloads = (future.result() for future in concurrent.futures.as_completed(futures))
+        return [payload for payload in payloads if payload is not None]
+
+    def shutdown(self):
+        for token in list(self._tokens.values()):
+            token.cancel()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._manager.shutdown()
+
+    def _forget(self, future: concurrent.futures.Future):
+        self._tokens.pop(future, None)
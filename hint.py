@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from data.canceltoken import CancelToken
+from data.move import STEPS
+from data.point import Point
+from data.solveresult import SolveResult
+from solver import BitMasks, Solver
+
+# Seconds a hint search may run before the position is given up on
+HINT_SECONDS = 2
+
+
+class HintEngine:
+    """
+    Finds the shortest pushes from wherever the player stands, on a background thread so the window keeps drawing.
+    Results are kept per position, the layout and the region the player can walk to. A shortest solution stays
+    shortest from every position along it, so each position it passes is stored with the moves that are left.
+    """
+
+    def __init__(self, onDone=None, seconds=HINT_SECONDS):
+        """
+         * @param onDone - called with no arguments from the search thread when a hint is found or given up on
+         """
+        self._onDone = onDone
+        self._seconds = seconds
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # Only used on the search thread
+        self._solver = Solver([[]], informed=True)
+        self._lock = threading.Lock()
+        # (layout, player region) -> (moves, index), the moves left from there are moves[index:]. moves is None
+        # when the search found none
+        self._positions = {}
+        # (position, CancelToken) of the newest search
+        self._running = None
+
+    def hint(self, grid, player: Point):
+        """
+         * @param grid - play grid, None in empty cells
+         * @return (moves, index) for the player's position, or None while it is searched for. Asking about another
+         *         position cancels the search for the previous one
+         """
+        cells = HintEngine._cells(grid)
+        position = HintEngine._position(cells, player)
+        with self._lock:
+            found = self._positions.get(position)
+        if found is not None:
+            return found
+        if self._running is not None:
+            if self._running[0] == position:
+                return None
+            self._running[1].cancel()
+        token = CancelToken()
+        self._running = (position, token)
+        self._executor.submit(self._search, cells, Point(player.getX(), player.getY()), position, token)
+        return None
+
+    def learn(self, grid, moves):
+        """
+         * Stores a known shortest solution, so the positions along it need no search
+         * @param moves - solution from the bottom left cell, as from Solver.getSolvedMoves
+         """
+        self._store(HintEngine._cells(grid), Point(len(grid) - 1, 0), moves)
+
+    def clear(self):
+        """Forgets every position, for a new board"""
+        if self._running is not None:
+            self._running[1].cancel()
+            self._running = None
+        with self._lock:
+            self._positions.clear()
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _search(self, cells, player: Point, position, token: CancelToken):
+        if token.isCancelled():
+            return
+        result = self._solver.setBoard(cells, player).solveWithin(time.monotonic() + self._seconds, token)
+        if result.status == SolveResult.CANCELLED:
+            return
+        if result.status == SolveResult.OPTIMAL:
+            self._store(cells, player, result.moves)
+        else:
+            # Unsolvable, or too hard to solve in time, either way there is no hint to show
+            with self._lock:
+                self._positions[position] = (None, 0)
+        if self._onDone is not None:
+            self._onDone()
+
+    def _store(self, cells, player: Point, moves):
+        rows = len(cells)
+        cols = len(cells[0])
+        masks = BitMasks.of(rows, cols)
+        blocks = Solver.packGrid(cells)
+        reach = Solver.region(1 << player.getX() * cols + player.getY(), blocks, masks)
+        positions = {}
+        for index, move in enumerate(moves):
+            positions[(blocks, reach)] = (moves, index)
+            dx, dy = STEPS[move.offsetType]
+            box = 1 << move.p.getX() * cols + move.p.getY()
+            blocks ^= box | 1 << (move.p.getX() + dx) * cols + move.p.getY() + dy
+            # The pusher ends up on the box's old cell
+            reach = Solver.region(box, blocks, masks)
+        positions[(blocks, reach)] = (moves, len(moves))
+        with self._lock:
+            self._positions.update(positions)
+
+    @staticmethod
+    def _cells(grid) -> [[]]:
+        return [[0 if cell is None else 1 for cell in row] for row in grid]
+
+    @staticmethod
+    def _position(cells, player: Point) -> tuple:
+        cols = len(cells[0])
+        blocks = Solver.packGrid(cells)
+        masks = BitMasks.of(len(cells), cols)
+        return blocks, Solver.region(1 << player.getX() * cols + player.getY(), blocks, masks)
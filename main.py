@@ -1,5 +1,7 @@
-from game import Game
-
 if __name__ == "__main__":
+    # Spawned pool workers and the token manager run this file as __mp_main__, importing the game here keeps
+    # Qt and the GUI modules out of them
+    from game import Game
+
     game = Game(6, 6)
     game.start()
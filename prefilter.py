@@ -0,0 +1,111 @@
+"""
+Batch stage in front of the solver: random boards are made thousands at a time as one NumPy array, and cheap
+vectorized checks drop the ones the solver would reject before any of them is searched. graded() goes on to solve
+the survivors together with Solver.solveMany.
+"""
+import numpy as np
+
+from solver import Solver
+
+BATCH = 2048
+
+_rng = np.random.default_rng()
+_survivors = {}
+
+
+def seed(value):
+    global _rng
+    _rng = np.random.default_rng(value)
+    _survivors.clear()
+
+
+def randomBoards(count, width, height, difficulty) -> np.ndarray:
+    """
+     * Same block count as utils.randomBoard: blocks only on the first width - 1 rows, the last row stays clear
+     * @return uint8 array of shape (count, width, height)
+     """
+    total = (width - 1) * height
+    blocks = int(total / 2 + total * (difficulty - 2) / 20)
+    blocks = min(max(blocks, 0), total)
+    # The `blocks` smallest of each row of random keys give a uniform choice of exactly that many cells
+    order = _rng.random((count, total)).argsort(axis=1)
+    boards = np.zeros((count, width, height), dtype=np.uint8)
+    boards[:, :width - 1, :] = (order < blocks).reshape(count, width - 1, height)
+    return boards
+
+
+def _flood(start: np.ndarray, passable: np.ndarray) -> np.ndarray:
+    """Four-way flood fill of every board at once"""
+    reach = start & passable
+    while True:
+        grown = reach.copy()
+        grown[:, 1:, :] |= reach[:, :-1, :]
+        grown[:, :-1, :] |= reach[:, 1:, :]
+        grown[:, :, 1:] |= reach[:, :, :-1]
+        grown[:, :, :-1] |= reach[:, :, 1:]
+        grown &= passable
+        if np.array_equal(grown, reach):
+            return reach
+        reach = grown
+
+
+def _frozen(filled: np.ndarray) -> np.ndarray:
+    """Solver._frozen for every board at once: blocks that keep an edge or a frozen block on each axis"""
+    frozen = filled.copy()
+    while True:
+        free = ~frozen
+        vertical = np.zeros_like(frozen)
+        vertical[:, 1:-1, :] = free[:, :-2, :] & free[:, 2:, :]
+        horizontal = np.zeros_like(frozen)
+        horizontal[:, :, 1:-1] = free[:, :, :-2] & free[:, :, 2:]
+        thawed = frozen & (vertical | horizontal)
+        # _push never moves blocks on the first and last rows
+        thawed[:, 0, :] = thawed[:, -1, :] = False
+        if not thawed.any():
+            return frozen
+        frozen &= ~thawed
+
+
+def plausible(boards: np.ndarray) -> np.ndarray:
+    """
+     * Necessary conditions for Solver.solve to grade a board above 0, checked for all boards together:
+     * the player must not already reach row 0 without a push, and row 0 must be reachable at all once blocks
+     * that can move are ignored. Frozen blocks never move, so they stay walls.
+     * @return boolean mask of the boards worth solving
+     """
+    filled = boards.astype(bool)
+    start = np.zeros_like(filled)
+    start[:, -1, 0] = True
+    free = _flood(start, ~filled)[:, 0, :].any(axis=1)
+    reachable = _flood(start, ~_frozen(filled))[:, 0, :].any(axis=1)
+    return reachable & ~free
+
+
+def nextCandidate(width, height, difficulty):
+    """
+     * A random board that passed plausible, taken from a cached batch that is refilled when it runs out
+     * @return board as a list of lists, or None when a whole new batch had no survivors
+     """
+    key = (width, height, difficulty)
+    survivors = _survivors.get(key)
+    if not survivors:
+        boards = randomBoards(BATCH, width, height, difficulty)
+        survivors = boards[plausible(boards)].tolist()
+        _survivors[key] = survivors
+    return survivors.pop() if survivors else None
+
+
+def graded(count, width, height, difficulty, timeout) -> list:
+    """
+     * Makes count random boards and solves the ones that pass plausible together with Solver.solveMany
+     * @param timeout - milliseconds for the whole batch
+     * @return utils.createBestPayload style (grid, [(x, y, offsetType), ...]) payloads of the boards that were
+     *         solved and need at least one push
+     """
+    boards = randomBoards(count, width, height, difficulty)
+    boards = boards[plausible(boards)].tolist()
+    payloads = []
+    for board, (pushes, moves) in zip(boards, Solver.solveMany(boards, timeout)):
+        if pushes > 0:
+            payloads.append((board, [(m.p.getX(), m.p.getY(), m.offsetType) for m in moves]))
+    return payloads
@@ -0,0 +1,119 @@
+import heapq
+import math
+import time
+
+from generator import BoardGenerator
+
+
+class BoardScheduler:
+    """
+    Decides what a BoardGenerator works on next. Requests wait in a priority queue and are only handed to the pool
+    when a worker is free, so an urgent board for a waiting player goes ahead of queued refills, and takes a
+    worker from a running refill if none is free. Refills keep depth() boards ready or in progress, sized from the
+    measured generation time and the player's measured time per board. Nothing is submitted once that depth is
+    reached, so the workers sit idle instead of generating boards nobody will play.
+    """
+    URGENT = 0
+    REFILL = 1
+    # Weight of the newest sample in the moving averages
+    SMOOTHING = 0.3
+
+    def __init__(self, generator: BoardGenerator, width, height, difficulty=3, urgentDuration=10, refillDuration=30,
+                 maxDepth=4, onDone=None):
+        """
+         * @param onDone - called with no arguments from a generator thread whenever a job finishes, so the owner can
+         *                 collect() without polling
+         """
+        self._generator = generator
+        self._onDone = onDone
+        self._job = (width, height, difficulty)
+        self._durations = {BoardScheduler.URGENT: urgentDuration, BoardScheduler.REFILL: refillDuration}
+        self._maxDepth = maxDepth
+        self._queue = []
+        self._sequence = 0
+        # Future -> (priority, submit time)
+        self._running = {}
+        self._generateSeconds = float(refillDuration)
+        self._playSeconds = float(refillDuration)
+        self._lastTaken = None
+
+    def depth(self) -> int:
+        """Boards to keep ready or in progress: enough to cover one generation at the player's pace, plus one"""
+        perBoard = self._generateSeconds / self._generator.getWorkers()
+        return max(1, min(self._maxDepth, math.ceil(perBoard / max(self._playSeconds, 1e-3)) + 1))
+
+    def requestUrgent(self):
+        """Asks for a board the player is waiting on, unless one is already queued or running"""
+        if self._count(BoardScheduler.URGENT) > 0:
+            return
+        self._push(BoardScheduler.URGENT)
+        if len(self._running) >= self._generator.getWorkers():
+            refills = [(submitted, future) for future, (priority, submitted) in self._running.items()
+                       if priority == BoardScheduler.REFILL]
+            if refills:
+                # The newest refill has made the least progress, and refill() requests it again later
+                self._generator.cancel(max(refills, key=lambda refill: refill[0])[1])
+        self._pump()
+
+    def refill(self, ready: int):
+        """
+         * Tops the queue up to depth()
+         * @param ready - generated boards waiting to be played
+         """
+        for _ in range(self.depth() - ready - len(self._queue) - len(self._running)):
+            self._push(BoardScheduler.REFILL)
+        self._pump()
+
+    def boardTaken(self):
+        """Records that the player started a board, which measures the player's time per board"""
+        now = time.monotonic()
+        if self._lastTaken is not None:
+            self._playSeconds = BoardScheduler._average(self._playSeconds, now - self._lastTaken)
+        self._lastTaken = now
+
+    def collect(self) -> list:
+        """
+         * @return payloads of the jobs that finished since the last call, see utils.createBestPayload
+         """
+        payloads = []
+        for future in [future for future in self._running if future.done()]:
+            priority, submitted = self._running.pop(future)
+            if future.cancelled():
+                continue
+            try:
+                payload = future.result()
+            except Exception as e:
+                print(f"Something went wrong: {e}")
+                continue
+            if payload is None:
+                continue
+            if priority == BoardScheduler.REFILL:
+                self._generateSeconds = BoardScheduler._average(self._generateSeconds,
+                                                                time.monotonic() - submitted)
+            payloads.append(payload)
+        self._pump()
+        return payloads
+
+    def shutdown(self):
+        self._queue.clear()
+        self._generator.shutdown()
+
+    def _count(self, priority) -> int:
+        return (sum(1 for entry in self._queue if entry[0] == priority)
+                + sum(1 for running, _ in self._running.values() if running == priority))
+
+    def _push(self, priority):
+        self._sequence += 1
+        heapq.heappush(self._queue, (priority, self._sequence))
+
+    def _pump(self):
+        while self._queue and len(self._running) < self._generator.getWorkers():
+            priority, _ = heapq.heappop(self._queue)
+            future = self._generator.submit(*self._job, self._durations[priority])
+            self._running[future] = (priority, time.monotonic())
+            if self._onDone is not None:
+                future.add_done_callback(lambda _: self._onDone())
+
+    @staticmethod
+    def _average(average, sample):
+        return average + BoardScheduler.SMOOTHING * (sample - average)
@@ -0,0 +1,147 @@
+"""
+LRU cache of finished solves in front of Solver.solveWithin, keyed by board size and packed layout. Only proven
+results are kept, a shortest solution or a finished search that found none, so a hit is as good as a solve.
+"""
+import collections
+import contextlib
+import json
+import os
+import threading
+
+from solver import Solver
+
+try:
+    import fcntl
+except ImportError:
+    # Windows locks a byte of the lock file with msvcrt instead
+    fcntl = None
+    import msvcrt
+
+VERSION = 1
+
+
+class SolveCache:
+
+    def __init__(self, maxSize: int = 4096, path: str = None):
+        """
+         * @param maxSize - entries kept before the least recently used one is evicted
+         * @param path - JSON file loaded now if it exists and written by save(), None to keep the cache in memory
+         """
+        self.maxSize = maxSize
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        # Threads share the cache, and a lookup both reads and reorders the entries
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def get(self, board: [[]]):
+        """
+         * @return (pushes, [push codes]) with codes in the Solver._decodeMove form, or None on a miss. Boards with
+         *         no solution are stored as (0, None)
+         """
+        key = SolveCache.key(board)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, board: [[]], pushes: int, codes):
+        key = SolveCache.key(board)
+        with self._lock:
+            self._entries[key] = (pushes, None if codes is None else tuple(codes))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"size": len(self._entries), "maxSize": self.maxSize, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hitRate": self.hits / lookups if lookups else 0.0}
+
+    def load(self, path: str):
+        """Adds the entries of a file written by save() as the least recently used ones"""
+        entries = SolveCache._read(path)
+        with self._lock:
+            ours = self._entries
+            self._entries = collections.OrderedDict(entries)
+            self._entries.update(ours)
+            for key in ours:
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def save(self, path: str = None):
+        """
+        Writes the cache to path, or the path it was created with, replacing the file in one step. Entries already
+        in the file are kept as the oldest. The read and write happen under a lock on path + ".lock", so processes
+        saving to a shared file at the same time add to it instead of overwriting each other.
+        """
+        path = path or self.path
+        with SolveCache._fileLock(path):
+            if os.path.exists(path):
+                self.load(path)
+            with self._lock:
+                entries = [[rows, cols, bits, pushes, None if codes is None else list(codes)]
+                           for (rows, cols, bits), (pushes, codes) in self._entries.items()]
+            temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp, "w") as f:
+                json.dump({"version": VERSION, "entries": entries}, f)
+            os.replace(temp, path)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _fileLock(path: str):
+        """Holds an exclusive lock on path + ".lock" across processes"""
+        with open(path + ".lock", "a+") as f:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+                return
+            f.seek(0)
+            # LK_LOCK gives up after ten seconds, so keep trying until the other save is done
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    @staticmethod
+    def _read(path: str) -> list:
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                # An unreadable cache is only lost work, the solves are redone
+                return []
+        if data.get("version") != VERSION:
+            return []
+        return [((rows, cols, bits), (pushes, None if codes is None else tuple(codes)))
+                for rows, cols, bits, pushes, codes in data["entries"]]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(board: [[]]) -> tuple:
+        return len(board), len(board[0]), Solver.packGrid(board)
@@ -1,53 +1,691 @@
 # from __future__ import annotations
 import collections
+import heapq
+import random
+import time
 from copy import deepcopy
+from functools import lru_cache
 
-import sortedcontainers
-
-import utils
+import diskruns
 from data.move import Move
 from data.point import Point
-from data.route import Route
+from data.node import Node
+from data.solveresult import SolveResult
+from data.solvestats import SolveStats, TimedDict, peakRss
+
+# Seconds a plain solve() may search before giving up
+TIME_LIMIT = 5
+# Bytes one solver may hold before its search spills to disk, so a worker per core stays within memory on big boards.
+# The generators' solvers and Solver.solveMany's one-board solves use it
+MEMORY_LIMIT = 256 * 2 ** 20
+# The searches check their deadline and cancel token every CHECK_EVERY nodes, a power of two
+CHECK_EVERY = 256
+# Estimated bytes a packed search holds per node and per visited map entry
+STATE_BYTES = 160
+# Estimated bytes per state an external search holds in memory on top of twice the record's size, once in its
+# layer's dict and once more in the sorted list written when the layer spills
+RECORD_BYTES = 150
+
+
+class BitMasks:
+    """Precomputed masks for a packed board, bit x * cols + y is the cell (x, y)"""
+    __slots__ = ("rows", "cols", "full", "firstRow", "lastRow", "notFirstCol", "notLastCol", "deadSquares",
+                 "pushable")
+
+    def __init__(self, rows: int, cols: int):
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << rows * cols) - 1
+        self.firstRow = (1 << cols) - 1
+        self.lastRow = self.firstRow << (rows - 1) * cols
+        firstCol = 0
+        for x in range(rows):
+            firstCol |= 1 << x * cols
+        self.notFirstCol = self.full ^ firstCol
+        self.notLastCol = self.full ^ (firstCol << cols - 1)
+        # _push refuses to move blocks on the first and last rows, so a block pushed there never moves again
+        self.deadSquares = self.firstRow | self.lastRow
+        self.pushable = self.full & ~self.deadSquares
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def of(rows: int, cols: int):
+        return BitMasks(rows, cols)
 
 
 class Solver:
 
-    def __init__(self, other, clone: bool = False):
-        if clone:
-            self.grid = other.grid
-            self.board = other.board
-            self.routes = other.routes
-            self.visited = other.visited
-            self.solvedMoves = other.solvedMoves
-            self.solvedPaths = other.solvedPaths
-        else:
-            self.grid = other
-            self.board = other
-            self.solvedPaths = 0
-            self.routes = collections.deque()
-            self.visited = set()
-            self.solvedMoves = None
+    def __init__(self, board: [[]], packed: bool = True, informed: bool = False, prune: bool = True,
+                 cache=None, collectStats: bool = False, memoryLimit: int = None, spillDir: str = None):
+        self.packed = packed
+        self.informed = informed
+        self.prune = prune
+        # solvecache.SolveCache consulted by solveWithin, or None
+        self.cache = cache
+        # solveWithin returns a SolveStats with each result when set, the searches skip all counting otherwise
+        self.collectStats = collectStats
+        # Bytes a packed search may hold before it starts over as _solveExternal, None for no limit
+        self.memoryLimit = memoryLimit
+        # Directory for _solveExternal's runs, None for the system temporary directory
+        self.spillDir = spillDir
+        # Player's starting Point, None for the bottom left cell every board starts at
+        self.start = None
+        self.pruned = 0
+        self._deadline = None
+        self._token = None
+        self._stopped = None
+        self._stats = None
+        self._overBudget = False
+        self._external = False
+        self.grid = board
+        self.board = board
+        self.solvedPaths = 0
+        self.routes = collections.deque()
+        self.visited = set()
+        self.solvedMoves = None
 
-    def setBoard(self, board: [[]]):
+    def setBoard(self, board: [[]], start: Point = None):
+        """
+         * @param start - where the player stands, None for the bottom left cell. Solves from anywhere else skip the
+         *                cache, which is keyed by the board alone
+         """
         self.grid = board
         self.board = board
+        self.start = start
         self.solvedPaths = 0
+        self.pruned = 0
         self.routes.clear()
         self.visited.clear()
         self.solvedMoves = None
         return self
 
     def solve(self) -> int:
-        first = Route()
-        first.grid = self.grid
-        first.player = Point(len(self.grid) - 1, 0)
+        return self.solveWithin(time.monotonic() + TIME_LIMIT).pushes
+
+    def solveWithin(self, deadline: float = None, token=None) -> SolveResult:
+        """
+         * @param deadline - time.monotonic() value to stop searching at, None for no limit
+         * @param token - data.canceltoken.CancelToken that stops the search once cancelled, or None
+         * @return how the search ended, with getSolvedMoves() as the moves of a solved result, and its
+         *         SolveStats when collectStats is set
+         """
+        self._deadline = deadline
+        self._token = token
+        self._stopped = None
+        self._overBudget = False
+        self._external = False
+        self._stats = SolveStats() if self.collectStats else None
+        began = time.perf_counter()
+        result = self._solveCached()
+        if self._stats is not None:
+            self._stats.solves = 1
+            self._stats.seconds = time.perf_counter() - began
+            self._stats.peakRss = peakRss()
+            result.stats = self._stats
+        return result
+
+    def _solveCached(self) -> SolveResult:
+        cols = len(self.grid[0])
+        cache = self.cache if self.start is None else None
+        if cache is not None:
+            cached = cache.get(self.board)
+            if cached is not None:
+                if self._stats is not None:
+                    self._stats.cacheHits = 1
+                pushes, codes = cached
+                if codes is None:
+                    return SolveResult(SolveResult.UNSOLVABLE)
+                self.solvedPaths = 1
+                self.solvedMoves = collections.deque(Solver._decodeMove(code, cols) for code in codes)
+                return SolveResult(SolveResult.OPTIMAL, pushes, self.solvedMoves)
+        if self.informed:
+            pushes = self._solveInformed()
+        elif self.packed:
+            pushes = self._solvePacked()
+        else:
+            pushes = self._solveGrid()
+        if self._overBudget:
+            # Started over rather than converted, the in-memory search only got as far as memoryLimit allows
+            self.routes = collections.deque()
+            self.visited = set()
+            pushes = self._solveExternal()
+        if self._stats is not None:
+            self._countVisited()
+        if self.solvedMoves is not None:
+            status = SolveResult.OPTIMAL if self._stopped is None else SolveResult.BEST
+            if cache is not None and status == SolveResult.OPTIMAL:
+                codes = [(m.p.getX() * cols + m.p.getY()) << 3 | m.offsetType for m in self.solvedMoves]
+                cache.put(self.board, pushes, codes)
+            return SolveResult(status, pushes, self.solvedMoves)
+        if cache is not None and self._stopped is None:
+            cache.put(self.board, 0, None)
+        return SolveResult(self._stopped or SolveResult.UNSOLVABLE)
+
+    def _newVisited(self, entries: dict) -> dict:
+        return entries if self._stats is None else TimedDict(self._stats, entries)
+
+    def _countVisited(self):
+        """Fills in the stats that can be read off the visited map once the search is over"""
+        if self._external:
+            # _solveExternal counts its states as it goes
+            return
+        self._stats.visitedSize = len(self.visited)
+
+    def _startPoint(self) -> Point:
+        if self.start is None:
+            return Point(len(self.grid) - 1, 0)
+        return Point(self.start.getX(), self.start.getY())
+
+    def _expired(self) -> bool:
+        if self._token is not None and self._token.isCancelled():
+            self._stopped = SolveResult.CANCELLED
+        elif self._deadline is not None and time.monotonic() >= self._deadline:
+            self._stopped = SolveResult.TIMED_OUT
+        return self._stopped is not None
+
+    def _overLimit(self, expanded: int) -> bool:
+        """Whether the nodes made so far and the visited map are estimated over memoryLimit. Expanded nodes are
+        kept alive by their children"""
+        if self.memoryLimit is not None and \
+                (expanded + len(self.routes) + len(self.visited)) * STATE_BYTES > self.memoryLimit:
+            self._overBudget = True
+        return self._overBudget
+
+    def _solvePacked(self) -> int:
+        """Breadth first search over pushes with the block layout packed into a single int"""
+        rows = len(self.grid)
+        cols = len(self.grid[0])
+        masks = BitMasks.of(rows, cols)
+        blocks = Solver.packGrid(self.grid)
+        # Packed nodes hold the player's whole reachable region, flood filled once when the node is made
+        start = self._startPoint()
+        stats = self._stats
+        first = Node(blocks, Solver.region(1 << start.getX() * cols + start.getY(), blocks, masks, stats))
         self.routes = collections.deque()
-        self.visited = set()
+        # Layout -> union of the player regions seen with it. The regions of one layout are disjoint, so a
+        # state is new exactly when the player's cell is outside that union
+        self.visited = self._newVisited({blocks: first.player})
+        if first.player & masks.firstRow:
+            return self._setSolution(first, cols)
+        self.routes.append(first)
+        expanded = 0
+        while len(self.routes) > 0:
+            expanded += 1
+            if expanded % CHECK_EVERY == 0 and (self._expired() or self._overLimit(expanded)):
+                return 0
+
+            if stats is not None:
+                stats.nodesExpanded += 1
+                stats.peakFrontier = max(stats.peakFrontier, len(self.routes))
+            r = self.routes.popleft()
+            for newBlocks, box, offsetType in Solver._packedPushes(r.player, r.grid, masks):
+                if stats is not None:
+                    stats.pushesGenerated += 1
+                seen = self.visited.get(newBlocks, 0)
+                if seen & box:
+                    if stats is not None:
+                        stats.duplicates += 1
+                    continue
+                dest = newBlocks & ~r.grid
+                reach = Solver._pushReach(r.player, box, dest, newBlocks, masks, stats)
+                self.visited[newBlocks] = seen | reach
+                # Moves are kept as (box index << 3 | offsetType) and only built when a solution is found
+                node = Node(newBlocks, reach, r, (box.bit_length() - 1) << 3 | offsetType)
+                if reach & masks.firstRow:
+                    # Every shallower state was made and checked before this layer, so this is a shortest solution
+                    return self._setSolution(node, cols)
+                if self.prune and Solver._isDeadPush(reach, dest, newBlocks, masks):
+                    self.pruned += 1
+                    continue
+                self.routes.append(node)
+        return 0
+
+    def _solveInformed(self) -> int:
+        """A* over packed states, ordered by pushes made plus Solver._pushesLeft"""
+        rows = len(self.grid)
+        cols = len(self.grid[0])
+        masks = BitMasks.of(rows, cols)
+        blocks = Solver.packGrid(self.grid)
+        start = self._startPoint()
+        stats = self._stats
+        reach = Solver.region(1 << start.getX() * cols + start.getY(), blocks, masks, stats)
+        estimate = Solver._pushesLeft(reach, blocks, self._walls(blocks, masks), masks)
+        self.routes = []
+        # Layout -> [region, fewest pushes] for each player region seen with it
+        self.visited = self._newVisited({blocks: [[reach, 0]]})
+        if estimate is None:
+            return 0
+        counter = 0
+        # Ties on f go to the deeper node, which is closer to a solution
+        heapq.heappush(self.routes, (estimate, 0, counter, Node(blocks, reach)))
+        expanded = 0
+        while len(self.routes) > 0:
+            expanded += 1
+            if expanded % CHECK_EVERY == 0 and (self._expired() or self._overLimit(expanded)):
+                return 0
+
+            if stats is not None:
+                stats.peakFrontier = max(stats.peakFrontier, len(self.routes))
+            f, _, _, r = heapq.heappop(self.routes)
+            if r.moves > Solver._regionEntry(self.visited[r.grid], r.player)[1]:
+                continue
+            if stats is not None:
+                stats.nodesExpanded += 1
+            if f == r.moves:
+                # The estimate is consistent and only 0 once row 0 is reachable, so this is a shortest solution
+                return self._setSolution(r, cols)
+
+            moves = r.moves + 1
+            for newBlocks, box, offsetType in Solver._packedPushes(r.player, r.grid, masks):
+                if stats is not None:
+                    stats.pushesGenerated += 1
+                regions = self.visited.setdefault(newBlocks, [])
+                entry = Solver._regionEntry(regions, box)
+                if entry is not None:
+                    if entry[1] <= moves:
+                        if stats is not None:
+                            stats.duplicates += 1
+                        continue
+                    entry[1] = moves
+                    reach = entry[0]
+                else:
+                    reach = Solver._pushReach(r.player, box, newBlocks & ~r.grid, newBlocks, masks, stats)
+                    regions.append([reach, moves])
+                estimate = Solver._pushesLeft(reach, newBlocks, self._walls(newBlocks, masks), masks)
+                if estimate is None:
+                    self.pruned += 1
+                    continue
+                counter += 1
+                node = Node(newBlocks, reach, r, (box.bit_length() - 1) << 3 | offsetType)
+                heapq.heappush(self.routes, (moves + estimate, -moves, counter, node))
+        return 0
+
+    def _solveExternal(self) -> int:
+        """
+        Breadth first search over the states of _solvePacked within memoryLimit bytes. Each layer of pushes is a
+        dict while every layer held in memory fits the limit. Once they don't, they are written to sorted runs on
+        disk (diskruns), and a new layer's duplicates are removed by merging it with the older layers. States are
+        records of the layout and the lowest cell of the player's region, followed by the push that made them, so
+        a solution is rebuilt by looking its states up one layer back at a time.
+        """
+        rows = len(self.grid)
+        cols = len(self.grid[0])
+        masks = BitMasks.of(rows, cols)
+        layoutSize = (rows * cols + 7) // 8
+        # Bytes for a cell index and for a push code, which holds the cell and three bits of offsetType
+        cellSize = ((rows * cols - 1).bit_length() + 7) // 8
+        codeSize = ((rows * cols << 3).bit_length() + 7) // 8
+        keySize = layoutSize + cellSize
+        size = keySize + codeSize
+        capacity = max(1, self.memoryLimit // (RECORD_BYTES + 2 * size))
+        self._external = True
+        stats = self._stats
+
+        def key(layout: int, region: int) -> bytes:
+            return layout.to_bytes(layoutSize, "big") + ((region & -region).bit_length() - 1).to_bytes(cellSize, "big")
+
+        def records(layer: dict) -> list:
+            return sorted(state + code.to_bytes(codeSize, "big") for state, code in layer.items())
+
+        def spill(layer: dict) -> diskruns.RunFile:
+            run = diskruns.RunFile.write(self.spillDir, records(layer), size)
+            files.append(run)
+            if stats is not None:
+                stats.spilledRecords += len(run)
+            return run
+
+        blocks = Solver.packGrid(self.grid)
+        start = self._startPoint()
+        reach = Solver.region(1 << start.getX() * cols + start.getY(), blocks, masks, stats)
+        if reach & masks.firstRow:
+            self.solvedPaths += 1
+            self.solvedMoves = collections.deque()
+            return 0
+        # A layer is a dict of state -> push code, or a RunFile of state + code records
+        layers = [{key(blocks, reach): 0}]
+        files = []
+        inMemory = 1
+        expanded = 0
+        try:
+            while True:
+                runs = []
+                nextLayer = {}
+                current = layers[-1]
+                for record in current:
+                    expanded += 1
+                    if expanded % CHECK_EVERY == 0 and self._expired():
+                        return 0
+                    if stats is not None:
+                        stats.nodesExpanded += 1
+                    state = record[:keySize]
+                    layout = int.from_bytes(state[:layoutSize], "big")
+                    region = Solver.region(1 << int.from_bytes(state[layoutSize:], "big"), layout, masks, stats)
+                    for newBlocks, box, offsetType in Solver._packedPushes(region, layout, masks):
+                        if stats is not None:
+                            stats.pushesGenerated += 1
+                        dest = newBlocks & ~layout
+                        newReach = Solver._pushReach(region, box, dest, newBlocks, masks, stats)
+                        code = (box.bit_length() - 1) << 3 | offsetType
+                        if newReach & masks.firstRow:
+                            codes = collections.deque([code])
+                            Solver._walkBack(layers, state, codes, masks, keySize, key)
+                            self.solvedPaths += 1
+                            self.solvedMoves = collections.deque(Solver._decodeMove(c, cols) for c in codes)
+                            return len(codes)
+                        if self.prune and Solver._isDeadPush(newReach, dest, newBlocks, masks):
+                            self.pruned += 1
+                            continue
+                        child = key(newBlocks, newReach)
+                        if child in nextLayer or any(child in layer for layer in layers if isinstance(layer, dict)):
+                            if stats is not None:
+                                stats.duplicates += 1
+                            continue
+                        nextLayer[child] = code
+                        inMemory += 1
+                        if inMemory > capacity:
+                            for depth, layer in enumerate(layers):
+                                if isinstance(layer, dict):
+                                    layers[depth] = spill(layer)
+                            runs.append(spill(nextLayer))
+                            if len(runs) == diskruns.FAN_IN:
+                                runs = [diskruns.RunFile.merge(self.spillDir, runs, keySize)]
+                                files.append(runs[0])
+                            nextLayer = {}
+                            # The layer being expanded is only freed once the loop is done with it
+                            inMemory = len(current) if isinstance(current, dict) else 0
+                if stats is not None:
+                    stats.peakFrontier = max(stats.peakFrontier, len(nextLayer) + sum(map(len, runs)))
+                older = [layer for layer in layers if not isinstance(layer, dict)]
+                if not runs:
+                    if older:
+                        found = diskruns.subtract(records(nextLayer), heapq.merge(*older), keySize)
+                        nextLayer = {record[:keySize]: int.from_bytes(record[keySize:], "big") for record in found}
+                        inMemory = sum(len(layer) for layer in layers if isinstance(layer, dict)) + len(nextLayer)
+                    layer = nextLayer
+                else:
+                    if nextLayer:
+                        runs.append(spill(nextLayer))
+                    layer = diskruns.RunFile.write(self.spillDir, diskruns.subtract(
+                        diskruns.unique(runs, keySize), heapq.merge(*older), keySize), size)
+                    files.append(layer)
+                    if stats is not None:
+                        stats.spilledRecords += len(layer)
+                    for run in runs:
+                        run.remove()
+                if stats is not None:
+                    stats.visitedSize += len(layer)
+                if len(layer) == 0:
+                    return 0
+                layers.append(layer)
+        finally:
+            for file in files:
+                file.remove()
+
+    @staticmethod
+    def _walkBack(layers: list, state: bytes, codes: collections.deque, masks: BitMasks, keySize: int, key):
+        """Prepends the pushes that led to state, found in the last of layers, by undoing them one layer at a time"""
+        cols = masks.cols
+        layoutSize = (masks.rows * masks.cols + 7) // 8
+        for layer in reversed(layers[1:]):
+            if isinstance(layer, dict):
+                code = layer[state]
+            else:
+                code = int.from_bytes(layer.find(state)[keySize:], "big")
+            codes.appendleft(code)
+            index = code >> 3
+            shift = (-cols, cols, -1, 1)[(code & 7) - 1]
+            layout = int.from_bytes(state[:layoutSize], "big") ^ 1 << index + shift ^ 1 << index
+            # The pusher stood one step behind the block
+            state = key(layout, Solver.region(1 << index - shift, layout, masks))
+
+    def _setSolution(self, node: Node, cols: int) -> int:
+        self.solvedPaths += 1
+        self.solvedMoves = collections.deque(Solver._decodeMove(code, cols) for code in node.getMoveList())
+        return node.moves
+
+    @staticmethod
+    def _regionEntry(regions: list, cell: int):
+        for entry in regions:
+            if entry[0] & cell:
+                return entry
+        return None
+
+    def _walls(self, blocks: int, masks: BitMasks) -> int:
+        if self.prune:
+            return Solver._frozen(blocks, masks)
+        return blocks & masks.deadSquares
+
+    @staticmethod
+    def _pushesLeft(reach: int, blocks: int, walls: int, masks: BitMasks):
+        """
+        Admissible lower bound on the pushes still needed: the fewest movable blocks on any path from the player's
+        region to row 0. walls are blocks that can never move. A push changes the count by at most one and never
+        frees a wall, which keeps the bound consistent. Returns None when no such path exists.
+        """
+        empty = masks.full & ~blocks
+        movable = blocks & ~walls
+        seen = reach
+        pushes = 0
+        while not seen & masks.firstRow:
+            ring = Solver._grow(seen, masks) & movable & ~seen
+            if not ring:
+                return None
+            seen = Solver._flood(seen | ring, empty | seen | ring, masks)
+            pushes += 1
+        return pushes
+
+    @staticmethod
+    def _frozen(blocks: int, masks: BitMasks) -> int:
+        """
+        Blocks that can never move again. Starting from every block, a block is dropped while it has an axis with
+        both neighbours inside the board and not frozen. What is left always keeps a frozen block or an edge on
+        each axis of every member, so none of them can be the first to move.
+        """
+        cols = masks.cols
+        frozen = blocks
+        while True:
+            free = masks.full & ~frozen
+            vertical = (free >> cols) & (free << cols)
+            horizontal = (free >> 1) & masks.notLastCol & (free << 1) & masks.notFirstCol
+            thawed = frozen & masks.pushable & (vertical | horizontal)
+            if not thawed:
+                return frozen
+            frozen ^= thawed
+
+    @staticmethod
+    def _isDeadPush(reach: int, dest: int, blocks: int, masks: BitMasks) -> bool:
+        """
+        Whether a push that left a block on dest cut the player off from row 0 for good. Only a block frozen by the
+        push can do that, so the frozen set is only built when dest has no open axis.
+        """
+        cols = masks.cols
+        empty = masks.full & ~blocks
+        if dest & masks.pushable and ((dest >> cols) & empty and (dest << cols) & empty
+                                      or (dest >> 1) & masks.notLastCol & empty
+                                      and (dest << 1) & masks.notFirstCol & empty):
+            return False
+        frozen = Solver._frozen(blocks, masks)
+        if not frozen & dest:
+            return False
+        return not Solver._flood(reach, masks.full & ~frozen, masks) & masks.firstRow
+
+    @staticmethod
+    def _decodeMove(code: int, cols: int) -> Move:
+        index = code >> 3
+        move = Move()
+        move.p = Point(index // cols, index % cols)
+        move.offsetType = code & 7
+        return move
+
+    @staticmethod
+    def packGrid(grid: [[]]) -> int:
+        bits = 0
+        cols = len(grid[0])
+        for x, row in enumerate(grid):
+            for y, val in enumerate(row):
+                if val == 1:
+                    bits |= 1 << x * cols + y
+        return bits
+
+    @staticmethod
+    def pushBound(board: [[]]):
+        """Lower bound on the pushes board needs from Solver._pushesLeft, or None when it is provably unsolvable"""
+        rows = len(board)
+        cols = len(board[0])
+        masks = BitMasks.of(rows, cols)
+        blocks = Solver.packGrid(board)
+        return Solver.packedBound(Solver.region(1 << (rows - 1) * cols, blocks, masks), blocks, masks)
+
+    @staticmethod
+    def solutionCells(board: [[]], moves) -> dict:
+        """
+        Cells the solution moves need empty: the player's walks between pushes, the cells it pushes from and the
+        cells blocks are pushed into. A block added anywhere else leaves the solution valid, so it cannot raise the
+        push count. Maps (x, y) to True for push cells and False for cells that are only walked over.
+        """
+        rows = len(board)
+        cols = len(board[0])
+        masks = BitMasks.of(rows, cols)
+        blocks = Solver.packGrid(board)
+        player = 1 << (rows - 1) * cols
+        cells = {}
+        steps = {1: cols, 2: -cols, 3: 1, 4: -1}
+        for move in moves:
+            box = move.p.getX() * cols + move.p.getY()
+            stand = 1 << box + steps[move.offsetType]
+            dest = 1 << box - steps[move.offsetType]
+            for cell in Solver._walk(player, stand, blocks, masks):
+                cells.setdefault(cell, False)
+            cells[stand.bit_length() - 1] = cells[dest.bit_length() - 1] = True
+            blocks ^= 1 << box | dest
+            player = 1 << box
+        for cell in Solver._walk(player, masks.firstRow, blocks, masks):
+            cells.setdefault(cell, False)
+        return {(cell // cols, cell % cols): push for cell, push in cells.items()}
+
+    @staticmethod
+    def _walk(player: int, target: int, blocks: int, masks: BitMasks) -> list:
+        """Cell indexes on a shortest walk from the player bit to any bit of target"""
+        empty = masks.full & ~blocks
+        layers = [player]
+        seen = player
+        while not layers[-1] & target:
+            layer = Solver._grow(layers[-1], masks) & empty & ~seen
+            if not layer:
+                return []
+            seen |= layer
+            layers.append(layer)
+        cell = layers[-1] & target
+        cell &= -cell
+        path = [cell.bit_length() - 1]
+        for layer in reversed(layers[:-1]):
+            cell = Solver._grow(cell, masks) & layer
+            cell &= -cell
+            path.append(cell.bit_length() - 1)
+        return path
+
+    @staticmethod
+    def unpackGrid(bits: int, rows: int, cols: int) -> [[]]:
+        return [[(bits >> x * cols + y) & 1 for y in range(cols)] for x in range(rows)]
+
+    @staticmethod
+    def region(player: int, blocks: int, masks: BitMasks, stats: SolveStats = None) -> int:
+        """
+        Bit-parallel flood fill of the empty cells reachable from the player bit, the packed region it can walk to.
+        The cells filled are added to stats.floodCells when stats are given
+        """
+        region = Solver._flood(player, masks.full & ~blocks, masks)
+        if stats is not None:
+            stats.floodCells += bin(region).count("1")
+        return region
+
+    @staticmethod
+    def _pushReach(reach: int, box: int, dest: int, blocks: int, masks: BitMasks, stats: SolveStats = None) -> int:
+        """
+        Player region after a push. When the block lands outside the old region, that region stays open and only
+        grows through the freed box cell, so the fill restarts from it instead of from the player's cell.
+        """
+        if reach & dest:
+            return Solver.region(box, blocks, masks, stats)
+        return Solver.region(reach | box, blocks, masks, stats)
+
+    @staticmethod
+    def _flood(region: int, passable: int, masks: BitMasks) -> int:
+        while True:
+            grown = Solver._grow(region, masks) & passable
+            if grown == region:
+                return region
+            region = grown
+
+    @staticmethod
+    def _grow(region: int, masks: BitMasks) -> int:
+        """The region plus its four-way neighbours"""
+        cols = masks.cols
+        return (region | (region << cols) | (region >> cols) | ((region << 1) & masks.notFirstCol)
+                | ((region >> 1) & masks.notLastCol)) & masks.full
+
+    @staticmethod
+    def _packedPushes(reach: int, blocks: int, masks: BitMasks):
+        """Yields (new layout, box bit, offsetType) for every push available from the reachable region"""
+        cols = masks.cols
+        empty = masks.full & ~blocks
+        boxes = blocks & masks.pushable
+        candidates = (
+            (1, boxes & (reach >> cols) & (empty << cols), -cols),
+            (2, boxes & (reach << cols) & (empty >> cols), cols),
+            (3, boxes & (reach >> 1) & masks.notLastCol & (empty << 1) & masks.notFirstCol, -1),
+            (4, boxes & (reach << 1) & masks.notFirstCol & (empty >> 1) & masks.notLastCol, 1),
+        )
+        for offsetType, found, shift in candidates:
+            while found:
+                box = found & -found
+                found ^= box
+                dest = box << shift if shift > 0 else box >> -shift
+                yield blocks ^ box ^ dest, box, offsetType
+
+    @staticmethod
+    def pulls(reach: int, blocks: int, masks: BitMasks):
+        """
+        Undoes each push that could have led to this state: a block next to the player's region is pulled one cell
+        into it and the player steps back. The block's new cell must be one _push can move blocks from.
+        Yields (layout, player region, push code) after each pull, where the code is the undone push in the
+        Solver._decodeMove form.
+        """
+        cols = masks.cols
+        cells = reach & masks.pushable
+        # A push of offsetType moves the block by shift, so its pull brings the block back from box + shift
+        candidates = (
+            (1, cells & (blocks << cols) & (reach >> cols), -cols),
+            (2, cells & (blocks >> cols) & (reach << cols), cols),
+            (3, cells & (blocks << 1) & masks.notFirstCol & (reach >> 1) & masks.notLastCol, -1),
+            (4, cells & (blocks >> 1) & masks.notLastCol & (reach << 1) & masks.notFirstCol, 1),
+        )
+        for offsetType, found, shift in candidates:
+            while found:
+                box = found & -found
+                found ^= box
+                index = box.bit_length() - 1
+                newBlocks = blocks ^ box ^ (1 << index + shift)
+                # The pulled block can cut the old region in two, so the region is filled again from the player
+                yield newBlocks, Solver.region(1 << index - shift, newBlocks, masks), index << 3 | offsetType
+
+    @staticmethod
+    def packedBound(reach: int, blocks: int, masks: BitMasks):
+        """Solver.pushBound for a packed state with the player anywhere in reach"""
+        return Solver._pushesLeft(reach, blocks, Solver._frozen(blocks, masks), masks)
+
+    def _solveGrid(self) -> int:
+        first = Node(self.grid, self._startPoint())
+        first.code = Solver._getGridCode(self.grid)
+        self.routes = collections.deque()
+        self.visited = self._newVisited({})
         self.routes.append(first)
-        solvedRoutes = sortedcontainers.SortedSet()
-        startTime = utils.getMillis()
+        solvedRoutes = []
+        stats = self._stats
+        expanded = 0
         while len(self.routes) > 0:
-            if utils.getMillis() - startTime > 5000:
+            expanded += 1
+            if expanded % CHECK_EVERY == 0 and self._expired():
                 if self.solvedPaths == 0:
                     return 0
                 else:
@@ -55,20 +693,21 @@ class Solver:
             if self.solvedPaths > 5:
                 break
 
+            if stats is not None:
+                stats.peakFrontier = max(stats.peakFrontier, len(self.routes))
             r = self.routes.popleft()
             if r is None:
                 continue
-            gridCode = Solver._getGridCode(r.grid)
-            if gridCode in self.visited:
-                continue
-            self.visited.add(gridCode)
+            if stats is not None:
+                stats.nodesExpanded += 1
 
             start = r.player
             if start.getX() == 0:
-                solvedRoutes.add(r)
+                solvedRoutes.append(r)
                 self.solvedPaths += 1
                 continue
             self.grid = r.grid
+            solved = False
 
             playerLocs = set()
             pMoves = collections.deque()
@@ -83,32 +722,78 @@ class Solver:
                 moves = self._validMoves(loc)
                 for p1 in moves:
                     if p1.getX() == -1:
-                        solvedRoutes.add(r)
-                        self.solvedPaths += 1
+                        solved = True
                         pMoves.clear()
                         break
                     if self.grid[p1.getX()][p1.getY()] != 1:
                         pMoves.append(p1)
 
+            if stats is not None:
+                stats.floodCells += len(playerLocs)
+            if solved:
+                solvedRoutes.append(r)
+                self.solvedPaths += 1
+                continue
+            # The same layout is a different state when the player is in a different region
+            region = min(playerLocs, key=lambda loc: (loc.getX(), loc.getY()))
+            if not self._markVisited(r.code, (region.getX(), region.getY(), r.grid)):
+                if stats is not None:
+                    stats.duplicates += 1
+                continue
+
+            queued = len(self.routes)
             for p in playerLocs:
                 self._getValidPush(p, self.grid, self._validMoves(p), r)
+            if stats is not None:
+                stats.pushesGenerated += len(self.routes) - queued
 
         if self.solvedPaths != 0 and len(solvedRoutes) > 0:
-            first1 = solvedRoutes.pop(0)
-            if first1 is None:
-                return 0
-            self.solvedMoves = first1.moveList
-            return len(first1.moveList)
+            first1 = min(solvedRoutes, key=lambda n: n.moves)
+            self.solvedMoves = first1.getMoveList()
+            return first1.moves
         else:
             return 0
 
+    @staticmethod
+    def solveMany(boards, timeout: int = 5000) -> list:
+        """
+        Solves many boards together with batchsolver.solveMany and returns (pushes, solved moves) per board.
+        Boards too big for its 64-bit layouts, or that go over its state budget, are solved one at a time, each
+        for at most TIME_LIMIT seconds as solve() would and within timeout milliseconds for all boards.
+        """
+        # numpy is only loaded by callers that batch solve
+        import batchsolver
+
+        deadline = time.monotonic() + timeout / 1000
+        small = [i for i, board in enumerate(boards) if len(board) * len(board[0]) <= batchsolver.MAX_CELLS]
+        results = [None] * len(boards)
+        for i, result in zip(small, batchsolver.solveMany([boards[i] for i in small], deadline)):
+            results[i] = result
+        for i, board in enumerate(boards):
+            if results[i] is None:
+                solver = Solver(board, memoryLimit=MEMORY_LIMIT)
+                result = solver.solveWithin(min(deadline, time.monotonic() + TIME_LIMIT))
+                results[i] = (result.pushes, result.moves) if result.status == SolveResult.OPTIMAL else (0, None)
+        return results
+
+    def detach(self):
+        """A new solver with a copy of this one's board and solution and none of its search state"""
+        solver = Solver(deepcopy(self.board), packed=self.packed, informed=self.informed, prune=self.prune,
+                        cache=self.cache, collectStats=self.collectStats, memoryLimit=self.memoryLimit,
+                        spillDir=self.spillDir)
+        solver.start = self.start
+        solver.solvedPaths = self.solvedPaths
+        if self.solvedMoves is not None:
+            solver.solvedMoves = collections.deque(self.solvedMoves)
+        return solver
+
     def getBoard(self) -> [[]]:
         return self.board
 
     def getSolvedMoves(self):
         return self.solvedMoves
 
-    def _getValidPush(self, start: Point, grid: [[]], moves, route: Route):
+    def _getValidPush(self, start: Point, grid: [[]], moves, route: Node):
         p: Point
         for p in moves:
             if p.getX() == -1:
@@ -116,17 +801,17 @@ class Solver:
             newGrid = deepcopy(grid)
             push = Solver._push(start.getX(), start.getY(), p.getX(), p.getY(), newGrid)
             if push is not None:
-                gridCode = Solver._getGridCode(newGrid)
-                if gridCode not in self.visited:
-                    r1 = deepcopy(route)
-                    r1.moveList.append(push)
-                    r1.moves += 1
-                    r1.grid = newGrid
-                    r1.player = push.p
-                    try:
-                        self.routes.append(r1)
-                    except Exception as e:
-                        print(f"Something went wrong: {e}")
+                node = Node(newGrid, push.p, route, push)
+                node.code = route.code ^ Solver._pushCode(push, len(grid), len(grid[0]))
+                self.routes.append(node)
+
+    def _markVisited(self, gridCode: int, state) -> bool:
+        """Zobrist codes can collide, so states sharing a code are compared exactly"""
+        states = self.visited.setdefault(gridCode, [])
+        if state in states:
+            return False
+        states.append(state)
+        return True
 
     def _validMoves(self, start: Point) -> set:
         out = set()
@@ -151,13 +836,41 @@ class Solver:
             out.add(Point(x - 1, y))
         return out
 
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _zobristTable(rows: int, cols: int) -> tuple:
+        """One random 64-bit key per cell, seeded so codes are stable between runs"""
+        rand = random.Random(rows * 1_000_003 + cols)
+        return tuple(rand.getrandbits(64) for _ in range(rows * cols))
+
     @staticmethod
     def _getGridCode(grid: [[]]) -> int:
+        """Zobrist code of the layout, the XOR of the keys of all filled cells"""
+        cols = len(grid[0])
+        table = Solver._zobristTable(len(grid), cols)
         val = 0
-        for i in grid:
-            val = 7 * val + utils.arrayHash(i)
+        for x, row in enumerate(grid):
+            for y, cell in enumerate(row):
+                if cell == 1:
+                    val ^= table[x * cols + y]
         return val
 
+    @staticmethod
+    def _pushCode(push: Move, rows: int, cols: int) -> int:
+        """Change to a layout's Zobrist code made by a push: the block leaves push.p and enters the next cell"""
+        x = push.p.getX()
+        y = push.p.getY()
+        if push.offsetType == 1:
+            dest = (x - 1) * cols + y
+        elif push.offsetType == 2:
+            dest = (x + 1) * cols + y
+        elif push.offsetType == 3:
+            dest = x * cols + y - 1
+        else:
+            dest = x * cols + y + 1
+        table = Solver._zobristTable(rows, cols)
+        return table[x * cols + y] ^ table[dest]
+
     @staticmethod
     def _push(playerX: int, playerY: int, boxX: int, boxY: int, grid: [[]]):
         if grid[boxX][boxY] != 1:
@@ -0,0 +1,60 @@
+import utils
+from data.board import Board
+from data.move import STEPS
+from data.point import Point
+from solver import Solver
+
+
+def _solvedBoard():
+    grid = [[0, 0, 0],
+            [1, 1, 1],
+            [0, 0, 0],
+            [0, 0, 0]]
+    solver = Solver(grid)
+    solver.solve()
+    return Board(utils.solverFromPayload((grid, [(m.p.getX(), m.p.getY(), m.offsetType)
+                                                 for m in solver.getSolvedMoves()])))
+
+
+def _play(board, moves):
+    """Makes solution pushes, whose p is the boulder pushed, from the cell behind each boulder"""
+    for move in moves:
+        dx, dy = STEPS[move.offsetType]
+        assert board.move(Point(move.p.getX() - dx, move.p.getY() - dy), move.offsetType)
+
+
+def test_solution_takes_fewest_pushes():
+    board = _solvedBoard()
+    _play(board, board.getMoveList())
+    assert board.getCurrentMoves() == board.getMoves()
+    assert board.tookFewestPushes()
+
+
+def test_undone_pushes_lose_the_bonus():
+    board = _solvedBoard()
+    moves = list(board.getMoveList())
+    _play(board, moves[:1])
+    board.undo()
+    _play(board, moves)
+    assert board.getCurrentMoves() == board.getMoves()
+    assert board.getTotalMoves() == board.getMoves() + 1
+    assert not board.tookFewestPushes()
+
+
+def test_reset_starts_the_count_again():
+    board = _solvedBoard()
+    moves = list(board.getMoveList())
+    _play(board, moves[:1])
+    board.reset()
+    _play(board, moves)
+    assert board.tookFewestPushes()
+
+
+def test_reset_returns_the_pushed_cells():
+    board = _solvedBoard()
+    first = list(board.getMoveList())[0]
+    _play(board, [first])
+    dx, dy = STEPS[first.offsetType]
+    x, y = first.p.getX(), first.p.getY()
+    assert board.reset() == {(x, y), (x + dx, y + dy)}
+    assert board.getBoard()[x][y] is not None and board.getBoard()[x + dx][y + dy] is None
@@ -1,36 +1,77 @@
+import collections
+import itertools
+import multiprocessing.util
+import os
+import threading
 import time
 from random import random
 
+import prefilter
+from data.move import STEPS, Move
 from data.point import Point
-from solver import Solver
+from data.solveresult import SolveResult
+from solvecache import SolveCache
+from solver import MEMORY_LIMIT, TIME_LIMIT, BitMasks, Solver
 
-SOLVER = Solver([[]])
-
-
-def arrayHash(a) -> int:
-    if a is None:
-        return 0
-    result = 1
-    for elem in a:
-        result = 31 * result + elem
-    return result
+CACHE_SIZE = 20_000
+# States generatePulledBoard pulls into before it tries another layout
+PULL_BUDGET = 2_000
+CACHE = SolveCache(CACHE_SIZE)
+_local = threading.local()
 
 
 def getMillis():
     return int(round(time.time() * 1000))
 
 
+def getSolver() -> Solver:
+    """
+     * The calling thread's own solver, reused between solves to avoid rebuilding it. Solvers handed out by the
+     * generate functions are detached copies, so they stay valid after the next solve
+     """
+    solver = getattr(_local, "solver", None)
+    if solver is None:
+        solver = _local.solver = Solver([[]], cache=CACHE, memoryLimit=MEMORY_LIMIT)
+    return solver
+
+
+def persistCache(path):
+    """
+     * Loads the solve cache file at path and saves back to it once, when this process exits, instead of after
+     * every job. Used as a pool initializer, where multiprocessing runs the finalizer as the worker shuts down
+     """
+    CACHE.path = path
+    if os.path.exists(path):
+        CACHE.load(path)
+    multiprocessing.util.Finalize(None, CACHE.save, exitpriority=0)
+
+
+def solveBefore(solver, deadline=None, token=None, stats=None):
+    """
+     * solver.solveWithin, stopping at the deadline or after TIME_LIMIT seconds, whichever comes first
+     * @param stats - SolveStats the solve's own stats are added to, or None to solve without counting
+     """
+    limit = time.monotonic() + TIME_LIMIT
+    collecting = solver.collectStats
+    solver.collectStats = collecting or stats is not None
+    result = solver.solveWithin(limit if deadline is None else min(deadline, limit), token)
+    solver.collectStats = collecting
+    if stats is not None:
+        stats.add(result.stats)
+    return result
+
+
 def getRandom(minVal, maxVal):
     """Helper random method, not directly using randrange (inaccuracies)"""
     return int(random() * (maxVal - minVal + 1) + minVal)
 
 
-def generateGameBoard(width, height, difficulty):
+def randomBoard(width, height, difficulty):
     """
      * @param width - width of board
      * @param height - height of board
      * @param difficulty - scale from 1 to 10, determines amount of blocks used
-     * @return board with a possible solution
+     * @return random board, which may not be solvable
      """
     width -= 1
     board = [[0 for _ in range(height)] for _ in range(width + 1)]
@@ -61,50 +102,239 @@ def generateGameBoard(width, height, difficulty):
                 filledPoints.add(o)
                 needed -= 1
                 board[x][y] = 1
-    solver = SOLVER.setBoard(board)
-    solve = solver.solve()
-    if solve != 0 and solve >= difficulty - 2:
-        return solver
+    return board
+
+
+def generateGameBoard(width, height, difficulty, deadline=None, token=None, stats=None):
+    """
+     * @param width - width of board
+     * @param height - height of board
+     * @param difficulty - scale from 1 to 10, determines amount of blocks used
+     * @param deadline - time.monotonic() value the solve must stop at
+     * @param token - CancelToken for the solve
+     * @param stats - SolveStats to add the solve's stats to
+     * @return board with a possible solution
+     """
+    board = prefilter.nextCandidate(width, height, difficulty)
+    if board is None:
+        return None
+    solver = getSolver().setBoard(board)
+    result = solveBefore(solver, deadline, token, stats)
+    if result.isSolved() and result.pushes != 0 and result.pushes >= difficulty - 2:
+        return solver.detach()
     return None
 
 
-def generateNextBoard(prev, prevMoves, timeOut):
+def generateNextBoard(prev, prevMoves, deadline, prevSolution=None, token=None, stats=None):
+    """
+     * Adds one block to prev so that it needs more than prevMoves pushes
+     * @param deadline - time.monotonic() value to give up at
+     * @param token - CancelToken, gives up once cancelled
+     * @param stats - SolveStats to add the stats of every solve to
+     * @param prevSolution - solved moves for prev. A block the solution never needs empty leaves the push count
+     *                       unchanged, so only the solution's cells are tried
+     * @return solver for the harder board, or None
+     """
     width = len(prev)
     height = len(prev[0])
-    for i in range(width - 1):
-        for j in range(height):
-            if prev[i][j] == 0:
-                if getMillis() > timeOut:
-                    return None
+    if prevSolution is None:
+        candidates = [(i, j) for i in range(width - 1) for j in range(height) if prev[i][j] == 0]
+    else:
+        cells = Solver.solutionCells(prev, prevSolution)
+        ranked = []
+        for i, j in cells:
+            if i < width - 1 and prev[i][j] == 0:
                 prev[i][j] = 1
-                if SOLVER.setBoard(prev).solve() > prevMoves:
-                    return Solver(SOLVER, True)
+                bound = Solver.pushBound(prev)
                 prev[i][j] = 0
+                # A provably unsolvable board is skipped without a search
+                if bound is not None:
+                    ranked.append((-bound, not cells[(i, j)], i, j))
+        # Highest lower bound first, then cells the solution pushes from or into
+        candidates = [(i, j) for _, _, i, j in sorted(ranked)]
+    for i, j in candidates:
+        if time.monotonic() >= deadline or token is not None and token.isCancelled():
+            return None
+        prev[i][j] = 1
+        solver = getSolver().setBoard(prev)
+        result = solveBefore(solver, deadline, token, stats)
+        if result.isSolved() and result.pushes > prevMoves:
+            harder = solver.detach()
+            prev[i][j] = 0
+            return harder
+        prev[i][j] = 0
+    return None
 
 
-def createBest(width, height, diff, duration):
+def createBest(width, height, diff, duration, token=None, stats=None):
+    """
+     * Generates a board and keeps making it harder. Every solve stops at the deadline, so the board made so far
+     * is returned duration seconds after the call
+     * @param token - CancelToken, once cancelled the board is abandoned and None is returned
+     * @param stats - SolveStats that sums the stats of every solve made for this board
+     """
     runs = 0
     val = 40_000 / width / height
-    now = getMillis()
+    deadline = time.monotonic() + duration
     solver = None
-    while solver is None and (getMillis() - now) < duration * 1_000:
-        solver = generateGameBoard(width, height, diff)
+    while solver is None and time.monotonic() < deadline:
+        if token is not None and token.isCancelled():
+            return None
+        solver = generateGameBoard(width, height, diff, deadline, token, stats)
         runs += 1
-        if runs % (val % diff) == 0:
+        # val % diff is 0 whenever diff divides val, e.g. 10x10 boards at difficulty 2
+        step = val % diff
+        if diff > 1 and step and runs % step == 0:
             diff -= 1
     if solver is None:
         return None
-    if (getMillis() - now) >= duration * 1_000:
-        return solver
-    while (getMillis() - now) < duration * 1_000:
+    while time.monotonic() < deadline:
         if solver.getSolvedMoves() is None:
             break
-        newSolver = generateNextBoard(solver.getBoard(), len(solver.getSolvedMoves()), now + duration * 1000)
+        newSolver = generateNextBoard(solver.getBoard(), len(solver.getSolvedMoves()), deadline,
+                                      solver.getSolvedMoves(), token, stats)
         if newSolver is None:
             break
         solver = newSolver
-    if solver.getSolvedMoves() is None:
+    if solver.getSolvedMoves() is None or token is not None and token.isCancelled():
+        return None
+    return solver
+
+
+def generatePulledBoard(width, height, pushes, difficulty, deadline=None, budget=None):
+    """
+     * Works backwards from a finished position with pulls, the inverse of Solver._push, so every board made is
+     * solvable and the pulls reversed are a solution. The pulls form a depth first search that backtracks at a dead
+     * end, trying the pulls that raise Solver.packedBound the most and leave further pulls first. Each state also
+     * carries an upper bound, one more than its parent's, or its pushes once solved. A state is only solved forward
+     * once that upper bound reaches pushes, and when the lower bound meets it no solve is needed at all. A state
+     * found to need more pushes is cut down by making the first pushes of its solution
+     * @param pushes - pushes the board must need
+     * @param difficulty - scale from 1 to 10, determines amount of blocks used
+     * @param deadline - time.monotonic() value to give up at
+     * @param budget - states pulled into before this layout is given up on, PULL_BUDGET by default
+     * @return solver for a board needing exactly pushes pushes, or None
+     """
+    budget = PULL_BUDGET if budget is None else budget
+    masks = BitMasks.of(width, height)
+    start = 1 << (width - 1) * height
+    blocks = Solver.packGrid(randomBoard(width, height, difficulty))
+    # Any region touching row 0 is a finished position, if a block can be pulled out of it
+    regions = {Solver.region(1 << y, blocks, masks) for y in range(height) if not blocks >> y & 1}
+    regions = [region for region in regions if next(Solver.pulls(region, blocks, masks), None) is not None]
+    if not regions:
+        return None
+    reach = regions[getRandom(0, len(regions) - 1)]
+    # [layout, player region, pull code, pulls left to try with the best last, most pushes it can need]
+    path = [[blocks, reach, None, _rankedPulls(blocks, reach, masks, pushes), 0]]
+    seen = {(blocks, reach)}
+    solver = Solver([[]], informed=True, memoryLimit=MEMORY_LIMIT)
+    while path and len(seen) <= budget:
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        options = path[-1][3]
+        if not options:
+            path.pop()
+            continue
+        blocks, reach, code, bound = options.pop()
+        if (blocks, reach) in seen:
+            continue
+        seen.add((blocks, reach))
+        pulled = len(path)
+        # Pushing the block back leads to the parent, so a state needs at most one push more than it
+        upper = path[-1][4] + 1
+        path.append([blocks, reach, code, _rankedPulls(blocks, reach, masks, pushes) if pulled < 4 * pushes else [],
+                     upper])
+        if upper < pushes or not reach & start or reach & masks.firstRow:
+            continue
+        board = Solver.unpackGrid(blocks, width, height)
+        if bound == upper == pulled:
+            codes = [path[i][2] for i in range(len(path) - 1, 0, -1)]
+            return solverFromPayload((board, [((c >> 3) // height, (c >> 3) % height, c & 7) for c in codes]))
+        result = solveBefore(solver.setBoard(board), deadline)
+        if result.status != SolveResult.OPTIMAL:
+            continue
+        if result.pushes >= pushes:
+            payload = _cutSolution(board, result.moves, result.pushes - pushes, masks)
+            if payload is not None:
+                return solverFromPayload(payload)
+        # The pulls below this state start counting from its real distance
+        path[-1][4] = result.pushes
+    return None
+
+
+def _cutSolution(board, moves, count, masks):
+    """
+     * Makes the first count pushes of a shortest solution. Every state along it is as far from the end as the
+     * pushes left, so the board reached needs exactly those, if the player can still walk back to the start
+     * @return (board, moves left) payload, or None
+     """
+    blocks = Solver.packGrid(board)
+    reach = 1 << (masks.rows - 1) * masks.cols
+    for move in itertools.islice(moves, count):
+        x, y = move.p.getX(), move.p.getY()
+        dx, dy = STEPS[move.offsetType]
+        box = 1 << x * masks.cols + y
+        blocks ^= box | 1 << (x + dx) * masks.cols + y + dy
+        reach = box
+    if not Solver.region(reach, blocks, masks) & 1 << (masks.rows - 1) * masks.cols:
+        return None
+    return (Solver.unpackGrid(blocks, masks.rows, masks.cols),
+            [(m.p.getX(), m.p.getY(), m.offsetType) for m in itertools.islice(moves, count, None)])
+
+
+def _rankedPulls(blocks, reach, masks, pushes) -> list:
+    """
+     * The pulls out of a state whose bound is at most pushes, as (layout, region, code, bound), ordered so the
+     * last has the highest bound and leaves pulls to make after it, with ties in random order
+     """
+    ranked = []
+    for newBlocks, newReach, code in Solver.pulls(reach, blocks, masks):
+        bound = Solver.packedBound(newReach, newBlocks, masks)
+        if bound is None or bound > pushes:
+            continue
+        further = next(Solver.pulls(newReach, newBlocks, masks), None) is not None
+        ranked.append((bound, further, random(), newBlocks, newReach, code))
+    ranked.sort()
+    return [(newBlocks, newReach, code, bound) for bound, _, _, newBlocks, newReach, code in ranked]
+
+
+def createPulled(width, height, pushes, duration, difficulty=3):
+    """
+     * generatePulledBoard until it succeeds or duration seconds have passed
+     * @return solver for a board needing exactly pushes pushes, or None
+     """
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        solver = generatePulledBoard(width, height, pushes, difficulty, deadline)
+        if solver is not None:
+            return solver
+    return None
+
+
+def createBestPayload(width, height, diff, duration, token=None):
+    """
+     * createBest for worker processes
+     * @param token - CancelToken around a multiprocessing manager Event, so the parent process can cancel it
+     * @return (grid, [(x, y, offsetType), ...]) as plain picklable lists, or None
+     """
+    solver = createBest(width, height, diff, duration, token)
+    if solver is None:
         return None
+    return solver.getBoard(), [(m.p.getX(), m.p.getY(), m.offsetType) for m in solver.getSolvedMoves()]
+
+
+def solverFromPayload(payload):
+    """Rebuilds a solved Solver from a createBestPayload result, so Board(solver) works unchanged"""
+    grid, moves = payload
+    solver = Solver(grid)
+    solver.solvedPaths = 1
+    solver.solvedMoves = collections.deque()
+    for x, y, offsetType in moves:
+        move = Move()
+        move.p = Point(x, y)
+        move.offsetType = offsetType
+        solver.solvedMoves.append(move)
     return solver
 
 